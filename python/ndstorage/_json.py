@@ -0,0 +1,19 @@
+"""
+JSON parsing for metadata and index entries, using orjson when it is installed since it is several times faster
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is None:
+    loads = json.loads
+else:
+    def loads(data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson is stricter than the json module, e.g. it rejects the NaN that json.dumps writes for nan floats
+            return json.loads(data)
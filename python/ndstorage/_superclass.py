@@ -1,9 +1,10 @@
 import os
+import functools
+import struct
 from ndstorage.ndtiff_dataset import NDTiffDataset
 from ndstorage.ndtiff_pyramid_dataset import NDTiffPyramidDataset
 from ndstorage.old_format_version_readers.nd_tiff_v2 import NDTiff_v2_0
 from ndstorage.old_format_version_readers.ndtiff_v1 import NDTiff_v1
-import numpy as np
 from ndstorage.file_io import NDTiffFileIO, BUILTIN_FILE_IO
 
 class Dataset:
@@ -23,39 +24,52 @@ class Dataset:
                 obj.__init__( dataset_path=dataset_path, file_io=file_io, summary_metadata=summary_metadata)
             return obj
 
-        # Search for Full resolution dir, check for index
-        res_dirs = [
-            dI for dI in file_io.listdir(dataset_path) if file_io.isdir(file_io.path_join(dataset_path, dI))
-        ]
-        if "Full resolution" not in res_dirs:
-            # Full resolution was removed ND Tiff starting in V3 for non-stitched
-            fullres_path = dataset_path
-            # but if it doesn't have an index, than something is wrong
-            if "NDTiff.index" not in file_io.listdir(fullres_path):
-                raise Exception('Cannot find NDTiff index')
-            # It must be an NDTiff >= 3.0 non-multi-resolution, loaded from disk
-            obj = NDTiffDataset.__new__(NDTiffDataset)
-            obj.__init__(dataset_path,  file_io=file_io)
-            return obj
-        fullres_path = (
-                dataset_path + ("" if dataset_path[-1] == os.sep else os.sep) + "Full resolution" + os.sep)
-        # It could still be a multi-res v3. Need to parse a Tiff and check major version
-        a_tiff_file = [file for file in file_io.listdir(fullres_path) if '.tif' in file][0]
-        file = file_io.open(fullres_path + a_tiff_file, "rb")
-        file.seek(12)
-        major_version = np.frombuffer(file.read(4), dtype=np.uint32)[0]
-        file.close()
-        if major_version == 3:
-            obj = NDTiffPyramidDataset.__new__(NDTiffPyramidDataset)
-            obj.__init__(dataset_path=dataset_path, file_io=file_io)
-            return obj
-
-        # It's a version 2 or a version 1. Check the name of the index file
-        if "NDTiff.index" in file_io.listdir(fullres_path):
-            obj = NDTiff_v2_0.__new__(NDTiff_v2_0)
-            obj.__init__(dataset_path, full_res_only=True, file_io=file_io)
-            return obj
+        if file_io is BUILTIN_FILE_IO:
+            # the type of a dataset on disk doesn't change, so it is only worked out again if the directory has been
+            # modified since. Only done for the builtin file IO, since the path might not be local otherwise
+            dataset_class, kwargs = _resolve_class_cached(os.path.abspath(dataset_path),
+                                                          os.stat(dataset_path).st_mtime_ns)
         else:
-            obj = NDTiff_v1.__new__(NDTiff_v1)
-            obj.__init__(dataset_path, full_res_only=True, file_io=file_io)
-            return obj
+            dataset_class, kwargs = _resolve_class(dataset_path, file_io)
+        obj = dataset_class.__new__(dataset_class)
+        obj.__init__(dataset_path, file_io=file_io, **kwargs)
+        return obj
+
+
+def _resolve_class(dataset_path, file_io):
+    """
+    Work out which class opens the dataset at dataset_path on disk
+
+    Returns
+    -------
+    the class, and a dict of extra keyword arguments for its __init__
+    """
+    # Search for Full resolution dir, check for index
+    entries = file_io.scandir(dataset_path)
+    res_dirs = {entry.name for entry in entries if entry.is_dir()}
+    if "Full resolution" not in res_dirs:
+        # Full resolution was removed ND Tiff starting in V3 for non-stitched
+        # but if it doesn't have an index, than something is wrong
+        if "NDTiff.index" not in {entry.name for entry in entries}:
+            raise Exception('Cannot find NDTiff index')
+        # It must be an NDTiff >= 3.0 non-multi-resolution, loaded from disk
+        return NDTiffDataset, {}
+    fullres_path = file_io.path_join(dataset_path, "Full resolution")
+    # It could still be a multi-res v3. Need to parse a Tiff and check major version
+    fullres_files = file_io.listdir(fullres_path)
+    a_tiff_file = [file for file in fullres_files if '.tif' in file][0]
+    with file_io.open(file_io.path_join(fullres_path, a_tiff_file), "rb") as file:
+        major_version = struct.unpack_from('<I', file.read(16), 12)[0]
+    if major_version == 3:
+        return NDTiffPyramidDataset, {}
+
+    # It's a version 2 or a version 1. Check the name of the index file
+    if "NDTiff.index" in fullres_files:
+        return NDTiff_v2_0, {'full_res_only': True}
+    else:
+        return NDTiff_v1, {'full_res_only': True}
+
+
+@functools.lru_cache(maxsize=128)
+def _resolve_class_cached(dataset_path, modification_time_ns):
+    return _resolve_class(dataset_path, BUILTIN_FILE_IO)
@@ -1,4 +1,5 @@
 import os
+import mmap
 import builtins
 from typing import Callable
 
@@ -8,21 +9,58 @@ BUILTIN_LISTDIR: Callable = os.listdir
 BUILTIN_PATH_JOIN: Callable = os.path.join
 BUILTIN_ISDIR: Callable = os.path.isdir
 
+
+def _builtin_mmap(file):
+    """Map a file opened with BUILTIN_OPEN into memory for reading"""
+    return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+BUILTIN_MMAP: Callable = _builtin_mmap
+
 class NDTiffFileIO:
 
     def __init__(self,
                  open_function: Callable = BUILTIN_OPEN,
                  listdir_function: Callable = BUILTIN_LISTDIR,
                  path_join_function: Callable = BUILTIN_PATH_JOIN, 
-                 isdir_function: Callable = BUILTIN_ISDIR):
-        """Define a group of IO functions for use within this module."""
+                 isdir_function: Callable = BUILTIN_ISDIR,
+                 mmap_function: Callable = BUILTIN_MMAP):
+        """
+        Define a group of IO functions for use within this module.
+        mmap_function takes a file returned by open_function and returns a read-only buffer with its contents,
+        or is None to always read files with seek/read
+        """
         self.open = open_function
         self.listdir = listdir_function
         self.path_join = path_join_function
         self.isdir = isdir_function
+        self.mmap = mmap_function
+
+    def scandir(self, path):
+        """
+        Return entries (with .name, .path and .is_dir()) for the contents of a directory. When the builtin
+        listdir and isdir are in use this is os.scandir, which gets the type of each entry together with its name
+        rather than with one extra call per entry
+        """
+        if self.listdir is BUILTIN_LISTDIR and self.isdir is BUILTIN_ISDIR:
+            with os.scandir(path) as entries:
+                return list(entries)
+        return [_DirEntry(self, path, name) for name in self.listdir(path)]
+
+
+class _DirEntry:
+    """Stand-in for os.DirEntry built from the functions of an NDTiffFileIO"""
+
+    def __init__(self, file_io: NDTiffFileIO, directory, name):
+        self._file_io = file_io
+        self.name = name
+        self.path = file_io.path_join(directory, name)
+
+    def is_dir(self):
+        return self._file_io.isdir(self.path)
 
 # Default values
 BUILTIN_FILE_IO = NDTiffFileIO(open_function = BUILTIN_OPEN,
                                listdir_function = BUILTIN_LISTDIR,
                                path_join_function = BUILTIN_PATH_JOIN, 
-                               isdir_function = BUILTIN_ISDIR)
\ No newline at end of file
+                               isdir_function = BUILTIN_ISDIR,
+                               mmap_function = BUILTIN_MMAP)
\ No newline at end of file
@@ -1,7 +1,13 @@
 from typing import List, Dict, Union
 
 import threading
-from ndstorage.ndstorage_base import WritableNDStorageAPI, NDStorageBase
+from ndstorage.ndstorage_base import WritableNDStorageAPI, NDStorageBase, _get_axis_order_key, _axes_memo_key, \
+    _KEY_MEMO_SIZE
+
+# default for dict.get on keys with no image, distinct from a stored None
+_MISSING = object()
+
+_STANDARD_AXES = ('channel', 'z', 'position', 'time', 'row', 'column')
 
 
 class NDRAMDataset(NDStorageBase, WritableNDStorageAPI):
@@ -9,12 +15,31 @@ class NDRAMDataset(NDStorageBase, WritableNDStorageAPI):
     A class for holding data in RAM
     Implements the methods needed to be a DataSink for AcqEngPy
     """
+    __slots__ = ('images', 'image_metadata', '_metadata_keys', '_metadata_columns', '_metadata_rows',
+                 '_num_metadata_rows', '_free_metadata_rows', '_finished_event', '_axis_key_order', '_key_memo', '_key_builders')
 
     def __init__(self):
         super().__init__()
         self.images = {}
+        # metadata that doesn't fit the column layout below
         self.image_metadata = {}
+        # most images in an acquisition have metadata with the same keys, so it is stored column-wise:
+        # one list of values per key of the first image's metadata, and the row of each image in those lists
+        self._metadata_keys = None
+        self._metadata_columns = []
+        self._metadata_rows = {}
+        self._num_metadata_rows = 0
+        # rows of images whose metadata has since been stored in image_metadata, to be reused
+        self._free_metadata_rows = []
         self._finished_event = threading.Event()
+        # images are keyed by a tuple of axis positions in this order (None for axes an image doesn't have)
+        self._axis_key_order = ()
+        # callers (e.g. viewers) tend to request the same coordinates repeatedly, so keys are memoized on the
+        # arguments they were built from. A plain dict rather than an lru_cache of a bound method, which would
+        # be a reference cycle keeping the dataset alive until the garbage collector finds it
+        self._key_memo = {}
+        # functions that build image keys, one for each combination of axes that has been requested
+        self._key_builders = {}
 
     def initialize(self, summary_metadata: dict):
         self.summary_metadata = summary_metadata
@@ -29,40 +54,179 @@ class NDRAMDataset(NDStorageBase, WritableNDStorageAPI):
         return self._finished_event.is_set()
 
     def put_image(self, coordinates, image, metadata):
-        key = frozenset(coordinates.items())
         self._infer_image_properties(image)
-        self.images[key] = image
-        self.image_metadata[key] = metadata
         self._update_axes(coordinates)
-        self._new_image_event.set()
+        key = self._make_key(coordinates)
+        self.images[key] = image
+        self._store_metadata(key, metadata)
+        self._notify_new_image()
 
     def get_image_coordinates_list(self) -> List[Dict[str, Union[int, str]]]:
-        frozen_set_list = list(self.images.keys())
-        # convert to dict
-        return [{axis_name: position for axis_name, position in key} for key in frozen_set_list]
+        axis_key_order = self._axis_key_order
+        # keys of images that have every axis need no filtering of missing (None) positions
+        return [dict(zip(axis_key_order, key)) if None not in key else self._coordinates_from_key(key)
+                for key in self.images]
 
     #### ND Storage API ####
     def close(self):
         self.images = {}
         self.image_metadata = {}
+        self._metadata_keys = None
+        self._metadata_columns = []
+        self._metadata_rows = {}
+        self._num_metadata_rows = 0
+        self._free_metadata_rows = []
         self.axes = {}
+        self._axis_key_order = ()
+        self._key_memo = {}
+        self._key_builders = {}
 
     def has_image(self, channel=None, z=None, time=None, position=None, row=None, column=None, **kwargs):
-        axes = self._consolidate_axes(channel, z, position, time, row, column, **kwargs)
-        key = frozenset(axes.items())
-        return key in self.images.keys()
+        key = self._key_from_axes(channel, z, position, time, row, column, **kwargs)
+        return key in self.images
 
     def read_image(self, channel=None, z=None, time=None, position=None, row=None, column=None, **kwargs):
-        axes = self._consolidate_axes(channel, z, position, time, row, column, **kwargs)
-        key = frozenset(axes.items())
-        if key not in self.images.keys():
-            raise Exception("image with keys {} not present in data set".format(key))
-        return self.images[key]
+        key = self._key_from_axes(channel, z, position, time, row, column, **kwargs)
+        image = self.images.get(key, _MISSING)
+        if image is _MISSING:
+            raise Exception("image with keys {} not present in data set".format(self._coordinates_from_key(key)))
+        return image
 
     def read_metadata(self, channel=None, z=None, time=None, position=None, row=None, column=None, **kwargs):
-        axes = self._consolidate_axes(channel, z, position, time, row, column, **kwargs)
-        key = frozenset(axes.items())
-        if key not in self.images.keys():
-            raise Exception("image with keys {} not present in data set".format(key))
-        return self.image_metadata[key]
+        key = self._key_from_axes(channel, z, position, time, row, column, **kwargs)
+        row_index = self._metadata_rows.get(key)
+        if row_index is not None:
+            return dict(zip(self._metadata_keys, [values[row_index] for values in self._metadata_columns]))
+        metadata = self.image_metadata.get(key, _MISSING)
+        if metadata is _MISSING:
+            raise Exception("image with keys {} not present in data set".format(self._coordinates_from_key(key)))
+        return metadata
+
+    ####### Private methods #######
+
+    def _read_image_if_present(self, coordinates):
+        key = self._key_from_axes(**{'channel': None, 'z': None, 'position': None, 'time': None,
+                                     'row': None, 'column': None, **coordinates})
+        return self.images.get(key)
+
+    def _update_axes(self, image_coordinates):
+        super()._update_axes(image_coordinates)
+        if len(self.axes) != len(self._axis_key_order):
+            self._update_axis_key_order()
+
+    def _update_axis_key_order(self):
+        """
+        A new axis has been seen. Recompute the canonical order of axes used for image keys
+        and rebuild the keys of the images already stored
+        """
+        old_order = self._axis_key_order
+        self._axis_key_order = tuple(axis_name for axis_name, _ in
+                                     sorted(self.axes.items(), key=_get_axis_order_key, reverse=True))
+        if old_order == self._axis_key_order:
+            return
+        # cached keys and key builders were made for the old order
+        self._key_memo = {}
+        self._key_builders = {}
+        self.images = {self._make_key(dict(zip(old_order, key))): image for key, image in self.images.items()}
+        self.image_metadata = {self._make_key(dict(zip(old_order, key))): metadata
+                               for key, metadata in self.image_metadata.items()}
+        self._metadata_rows = {self._make_key(dict(zip(old_order, key))): row
+                               for key, row in self._metadata_rows.items()}
+
+    def _store_metadata(self, key, metadata):
+        """
+        Store the metadata of an image in the metadata columns if it has the same keys as the first image's
+        metadata, otherwise in image_metadata
+        """
+        if self._metadata_keys is None and isinstance(metadata, dict):
+            self._metadata_keys = tuple(metadata.keys())
+            self._metadata_columns = [[] for _ in self._metadata_keys]
+        if not isinstance(metadata, dict) or tuple(metadata.keys()) != self._metadata_keys:
+            row = self._metadata_rows.pop(key, None)
+            if row is not None:
+                self._free_metadata_rows.append(row)
+            self.image_metadata[key] = metadata
+            return
+        self.image_metadata.pop(key, None)
+        row = self._metadata_rows.get(key)
+        if row is None and self._free_metadata_rows:
+            row = self._free_metadata_rows.pop()
+            self._metadata_rows[key] = row
+        if row is None:
+            # new image, append a row
+            for column, value in zip(self._metadata_columns, metadata.values()):
+                column.append(value)
+            self._metadata_rows[key] = self._num_metadata_rows
+            self._num_metadata_rows += 1
+        else:
+            # image was replaced, or a row is free, overwrite it
+            for column, value in zip(self._metadata_columns, metadata.values()):
+                column[row] = value
+
+    def _key_from_axes(self, channel, z, position, time, row, column, **kwargs):
+        """
+        Get the image key for the given axis positions, memoized on the raw arguments
+        """
+        other_axes = tuple(sorted(kwargs.items()))
+        memo_key = _axes_memo_key(channel, z, position, time, row, column, other_axes)
+        key = self._key_memo.get(memo_key)
+        if key is None:
+            key = self._key_from_axes_uncached(channel, z, position, time, row, column, other_axes)
+            if len(self._key_memo) >= _KEY_MEMO_SIZE:
+                self._key_memo.clear()
+            self._key_memo[memo_key] = key
+        return key
+
+    def _key_from_axes_uncached(self, channel, z, position, time, row, column, other_axes):
+        if any(axis_name == 'channel_name' for axis_name, _ in other_axes):
+            # deprecated alias, let _consolidate_axes handle it and warn
+            axes = self._consolidate_axes(channel, z, position, time, row, column, **dict(other_axes))
+            return self._make_key(axes)
+        names = _STANDARD_AXES + tuple(axis_name for axis_name, _ in other_axes)
+        positions = (channel, z, position, time, row, column) + tuple(position for _, position in other_axes)
+        signature = tuple(axis_name for axis_name, position in zip(names, positions) if position is not None)
+        key_builder = self._key_builders.get(signature)
+        if key_builder is None:
+            key_builder = self._make_key_builder(signature)
+            self._key_builders[signature] = key_builder
+        return key_builder([position for position in positions if position is not None])
+
+    def _make_key_builder(self, axis_names):
+        """
+        Make a function that converts positions along the given axes (in the same order) to an image key,
+        with the same result as _consolidate_axes followed by _make_key. The slot of each axis in the key and
+        whether it is a string axis are looked up here once rather than on every call
+        """
+        slots = []
+        for key_axis_name in self._axis_key_order:
+            if key_axis_name not in axis_names:
+                slots.append((None, None))
+                continue
+            string_values = self._string_axes_values[key_axis_name] \
+                if self.axes_types[key_axis_name] == str else None
+            slots.append((axis_names.index(key_axis_name), string_values))
+        for axis_name in axis_names:
+            if axis_name not in self.axes_types:
+                raise KeyError(axis_name)
+
+        def build_key(positions):
+            key = []
+            for index, string_values in slots:
+                if index is None:
+                    key.append(None)
+                elif string_values is not None and type(positions[index]) == int:
+                    # convert string-valued axes passed as ints into strings
+                    key.append(string_values[positions[index]])
+                else:
+                    key.append(positions[index])
+            return tuple(key)
+        return build_key
+
+    def _make_key(self, axes):
+        """
+        Convert a dict of image coordinates to a tuple of positions in canonical axis order
+        """
+        return tuple(axes.get(axis_name) for axis_name in self._axis_key_order)
 
+    def _coordinates_from_key(self, key):
+        return {axis_name: position for axis_name, position in zip(self._axis_key_order, key) if position is not None}
@@ -13,10 +13,12 @@ from typing import Any, Dict, List, Union, Tuple
 import numpy as np
 import dask
 import warnings
-from sortedcontainers import SortedSet
-from functools import partial
 import dask.array as da
 import threading
+import os
+import functools
+import collections
+from concurrent.futures import ThreadPoolExecutor
 
 from ndstorage.ndtiff_file import _POSITION_AXIS, _ROW_AXIS, _COLUMN_AXIS, _Z_AXIS, _TIME_AXIS, _CHANNEL_AXIS
 
@@ -35,17 +37,116 @@ def _get_axis_order_key(dict_item):
     else:
         return 3  # stack next to channel axes
 
+@functools.lru_cache(maxsize=64)
+def _stitched_tile_layout(first_row, last_row, first_column, last_column, tile_h, tile_w):
+    """
+    Where each tile goes in a stitched image covering the given rows and columns (missing ones included)
+
+    Returns
+    -------
+    shape of the stitched image, and a tuple of (row, column, slice of the stitched image), one per tile
+    """
+    tiles = tuple((row, column, (slice(row_index * tile_h, (row_index + 1) * tile_h),
+                                 slice(column_index * tile_w, (column_index + 1) * tile_w)))
+                  for row_index, row in enumerate(range(first_row, last_row + 1))
+                  for column_index, column in enumerate(range(first_column, last_column + 1)))
+    return ((last_row - first_row + 1) * tile_h, (last_column - first_column + 1) * tile_w), tiles
+
+# approximate size of the dask array chunks made by as_array(chunks='auto')
+_AUTO_CHUNK_BYTES = 128 * 1024 * 1024
+
+# shared by all datasets for reading the tiles of stitched images in parallel. Created on first use
+_tile_read_executor = None
+_tile_read_executor_lock = threading.Lock()
+
+def _get_tile_read_executor():
+    global _tile_read_executor
+    with _tile_read_executor_lock:
+        if _tile_read_executor is None:
+            _tile_read_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1,
+                                                     thread_name_prefix='ndstorage_tile_read')
+        return _tile_read_executor
+
+# number of image keys each dataset memoizes before starting over
+_KEY_MEMO_SIZE = 1024
+
+def _axes_memo_key(channel, z, position, time, row, column, other_axes):
+    """
+    The key under which the image key for the given arguments of read_image etc. is memoized. The types of the
+    positions are part of it, since e.g. 1 and True (which are equal) are converted differently on
+    string-valued axes
+    """
+    positions = (channel, z, position, time, row, column) + tuple(position for _, position in other_axes)
+    return other_axes, positions, tuple(type(position) for position in positions)
+
+
+class _AxisPositions:
+    """
+    The set of positions seen along one axis, iterated in sorted order. Adding a position is just a set insert
+    (plus an append when it is past the end); the sorted list is otherwise rebuilt only when it is read after
+    new positions were added
+    """
+    __slots__ = ('_set', '_sorted_list')
+
+    def __init__(self, positions=()):
+        self._set = set(positions)
+        self._sorted_list = None
+
+    def add(self, position):
+        if position not in self._set:
+            self._set.add(position)
+            if self._sorted_list is not None and self._sorted_list and position > self._sorted_list[-1]:
+                # positions usually arrive in increasing order (e.g. time points), which keeps the list sorted
+                self._sorted_list.append(position)
+            else:
+                self._sorted_list = None
+
+    def _sorted(self):
+        if self._sorted_list is None:
+            self._sorted_list = sorted(self._set)
+        return self._sorted_list
+
+    def index(self, position):
+        return self._sorted().index(position)
+
+    def __contains__(self, position):
+        return position in self._set
+
+    def __len__(self):
+        return len(self._set)
+
+    def __iter__(self):
+        return iter(self._sorted())
+
+    def __getitem__(self, index):
+        return self._sorted()[index]
+
+    def __eq__(self, other):
+        if isinstance(other, _AxisPositions):
+            return self._set == other._set
+        if isinstance(other, (set, frozenset)):
+            return self._set == other
+        return NotImplemented
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self._sorted())
+
+
 class NDStorageAPI(ABC):
     """
     API for NDStorage classes
     """
+    # Attributes are declared as slots for faster access and smaller instances. Subclasses that don't declare
+    # __slots__ themselves still get a __dict__ for any other attributes
+    __slots__ = ('axes_types', 'axes', 'summary_metadata', '__weakref__')
+
     def __init__(self):
         # a dictionary of the types (int or str) of each axis
         # {'channel': str, 'z': int, 'time': int}
         self.axes_types = {}
 
         # a list of all the axes that have been seen with their values in order
-        # e.g. {'time': SortedSet([0, 1, 2, 3, 4, 5, 6, 7, 8, 9])}
+        # e.g. {'time': _AxisPositions([0, 1, 2, 3, 4, 5, 6, 7, 8, 9])}
         self.axes = {}
 
         # Metadata that applies to the entire dataset
@@ -192,7 +293,7 @@ class NDStorageAPI(ABC):
 
 
     @abstractmethod
-    def as_array(self, axes: List[str] = None, stitched: bool = False,
+    def as_array(self, axes: List[str] = None, stitched: bool = False, chunks: Union[None, str, int] = None,
                  **kwargs: Union[int, str]) -> 'dask.array':
         """
         Create one big Dask array with last two axes as y, x and preceding axes depending on data.
@@ -212,6 +313,11 @@ class NDStorageAPI(ABC):
         stitched : bool, optional
             If True and tiles were acquired in a grid, lay out adjacent tiles next to one another
             (Default value = False)
+        chunks : None, 'auto' or int, optional
+            Number of images along the last stacked axis in each chunk of the dask array. None gives one image per
+            chunk, which suits viewers that read one image at a time. Larger chunks make computing over the whole
+            array faster, since there are fewer tasks. 'auto' picks a number that makes chunks about 128 MB.
+            Not used when stitched is True (Default value = None)
         **kwargs :
             Names and integer positions of axes on which to slice data
 
@@ -226,6 +332,7 @@ class WritableNDStorageAPI(NDStorageAPI):
     """
     API for NDStorage classes to which images can be written
     """
+    __slots__ = ()
 
     @abstractmethod
     def put_image(self, coordinates, image, metadata):
@@ -280,9 +387,18 @@ class NDStorageBase(NDStorageAPI):
     """
     Base class with helpful methods for reading and writing ND data
     """
+    __slots__ = ('_string_axes_values', '_string_axes_value_sets', 'image_width', 'image_height', 'dtype',
+                 'bytes_per_pixel', '_overlap', '_full_resolution', '_empty_tile', '_new_image_event')
+
+    # Whether the tiles of stitched images are read on a thread pool. Worth it for subclasses whose read_image
+    # does I/O (which releases the GIL), not for ones that return images already in memory
+    _parallel_tile_reads = False
+
     def __init__(self):
         super().__init__()
+        # the values of each string axis in the order they were first seen, plus a set of them for fast lookup
         self._string_axes_values = {}
+        self._string_axes_value_sets = {}
 
         self.image_width = None
         self.image_height = None
@@ -292,6 +408,8 @@ class NDStorageBase(NDStorageAPI):
         # for stitched datasets
         self._overlap = None
         self._full_resolution = None
+        # zeros returned in place of missing images, shared across as_array calls
+        self._empty_tile = None
 
         self._new_image_event = threading.Event()
 
@@ -437,7 +555,7 @@ class NDStorageBase(NDStorageAPI):
 
 
     ####### Implementated methods #######
-    def as_array(self, axes: List[str] = None, stitched: bool = False,
+    def as_array(self, axes: List[str] = None, stitched: bool = False, chunks: Union[None, str, int] = None,
                  **kwargs: Union[int, str]) -> 'dask.array':
         """
         Create one big Dask array with last two axes as y, x and preceding axes depending on data.
@@ -457,6 +575,11 @@ class NDStorageBase(NDStorageAPI):
         stitched : bool, optional
             If True and tiles were acquired in a grid, lay out adjacent tiles next to one another
             (Default value = False)
+        chunks : None, 'auto' or int, optional
+            Number of images along the last stacked axis in each chunk of the dask array. None gives one image per
+            chunk, which suits viewers that read one image at a time. Larger chunks make computing over the whole
+            array faster, since there are fewer tasks. 'auto' picks a number that makes chunks about 128 MB.
+            Not used when stitched is True (Default value = None)
         **kwargs :
             Names and integer positions of axes on which to slice data
 
@@ -481,11 +604,7 @@ class NDStorageBase(NDStorageAPI):
             w = self.image_width - self._overlap[1]
             h = self.image_height - self._overlap[0]
 
-        self._empty_tile = (
-            np.zeros((h, w), self.dtype)
-            if self.bytes_per_pixel != 3
-            else np.zeros((h, w, 3), self.dtype)
-        )
+        self._update_empty_tile(h, w)
 
         rgb = self.bytes_per_pixel == 3 and self.dtype == np.uint8
 
@@ -503,73 +622,146 @@ class NDStorageBase(NDStorageAPI):
             if _COLUMN_AXIS in axes_to_slice:
                 del axes_to_slice[_COLUMN_AXIS]
 
-        chunks = tuple([(1,) * len(axes_to_stack[axis]) for axis in axes_to_stack.keys()])
+        images_per_chunk = 1
+        if chunks is not None and not stitched and axes_to_stack:
+            if chunks == 'auto':
+                images_per_chunk = max(1, _AUTO_CHUNK_BYTES // (h * w * self.bytes_per_pixel))
+            else:
+                images_per_chunk = int(chunks)
+            images_per_chunk = max(1, min(images_per_chunk, len(list(axes_to_stack.values())[-1])))
+        # the last stacked axis is split into chunks of images_per_chunk, the others have one image per chunk
+        array_chunks = tuple([(1,) * len(axes_to_stack[axis]) for axis in axes_to_stack.keys()])
+        if images_per_chunk > 1:
+            num_positions = len(list(axes_to_stack.values())[-1])
+            array_chunks = array_chunks[:-1] + ((images_per_chunk,) * (num_positions // images_per_chunk) +
+                                                ((num_positions % images_per_chunk,)
+                                                 if num_positions % images_per_chunk else ()),)
+        tile_layout, tile_crop = None, None
         if stitched:
-            row_values = np.array(list(self.axes[_ROW_AXIS]))
-            column_values = np.array(list(self.axes[_COLUMN_AXIS]))
-            chunks += (h * (np.max(row_values) - np.min(row_values) + 1),
-                       w * (np.max(column_values) - np.min(column_values) + 1))
+            # get spatial layout of position indices, filling in missing values
+            rows = self.axes[_ROW_AXIS]
+            columns = self.axes[_COLUMN_AXIS]
+            tile_layout = _stitched_tile_layout(int(rows[0]), int(rows[-1]), int(columns[0]), int(columns[-1]),
+                                                int(h), int(w))
+            array_chunks += tile_layout[0]
+            # remove half of the overlap around each tile so that that image stitches correctly
+            # only need this for full resoution because downsampled ones already have the edges removed
+            if self._full_resolution and np.any(self._overlap > 0):
+                min_index = np.floor(self._overlap / 2).astype(np.int_)
+                tile_crop = (slice(min_index[0], min_index[0] + h), slice(min_index[1], min_index[1] + w))
         else:
-            chunks += (h, w)
+            array_chunks += (h, w)
         if rgb:
-            chunks += (3,)
+            array_chunks += (3,)
+
+        read_one_image = self._read_one_image_for_large_array
+        stacked_axes = tuple(axes_to_stack.items())
+
+        def read_block(block_id):
+            # arguments are bound here and passed positionally, rather than merged into kwargs on every block
+            return read_one_image(block_id, stacked_axes, axes_to_slice, stitched, tile_layout, tile_crop,
+                                  images_per_chunk)
 
         array = da.map_blocks(
-            partial(self._read_one_image_for_large_array, overlap=self._overlap, full_resolution=self._full_resolution,
-                    axes_to_stack=axes_to_stack, axes_to_slice=axes_to_slice, stitched=stitched, rgb=rgb),
+            read_block,
             dtype=self.dtype,
-            chunks=chunks,
+            chunks=array_chunks,
             meta=self._empty_tile
         )
 
         return array
 
-    def _read_one_image_for_large_array(self, block_id, overlap, full_resolution,
-                                        axes_to_stack=None, axes_to_slice=None, stitched=False, rgb=False):
+    def _read_one_image_for_large_array(self, block_id, stacked_axes, axes_to_slice, stitched, tile_layout,
+                                        tile_crop, images_per_chunk):
         # a function that reads in one chunk of data
-        axes = {key: axes_to_stack[key][block_id[i]] for i, key in enumerate(axes_to_stack.keys())}
+        # stacked_axes is a tuple of (axis name, list of positions), one per leading block index
+        if images_per_chunk > 1:
+            return self._read_image_stack_for_large_array(block_id, stacked_axes, axes_to_slice, images_per_chunk)
+        axes = {axis_name: positions[index] for (axis_name, positions), index in zip(stacked_axes, block_id)}
         if stitched:
             # Combine all rows and cols into one stitched image
-            # get spatial layout of position indices
-            row_values = np.array(list(self.axes["row"]))
-            column_values = np.array(list(self.axes["column"]))
-            # fill in missing values
-            row_values = np.arange(np.min(row_values), np.max(row_values) + 1)
-            column_values = np.arange(np.min(column_values), np.max(column_values) + 1)
-            # make nested list of rows and columns
-            blocks = []
-            for row in row_values:
-                blocks.append([])
-                for column in column_values:
-                    # remove overlap between tiles
-                    if not self.has_image(**axes, **axes_to_slice, row=row, column=column):
-                        blocks[-1].append(self._empty_tile)
-                    else:
-                        tile = self.read_image(**axes, **axes_to_slice, row=row, column=column)
-                        # remove half of the overlap around each tile so that that image stitches correctly
-                        # only need this for full resoution because downsampled ones already have the edges removed
-                        if np.any(overlap[0] > 0) and full_resolution:
-                            min_index = np.floor(overlap / 2).astype(np.int_)
-                            max_index = np.ceil(overlap / 2).astype(np.int_)
-                            tile = tile[min_index[0]:-max_index[0], min_index[1]:-max_index[1]]
-                        blocks[-1].append(tile)
-
-            if rgb:
-                image = np.concatenate([np.concatenate(row, axis=len(blocks[0][0].shape) - 2)
-                        for row in blocks],  axis=0)
-            else:
-                image = np.array(da.block(blocks))
-        else:
-            if not self.has_image(**axes, **axes_to_slice):
-                image = self._empty_tile
-            else:
-                image = self.read_image(**axes, **axes_to_slice)
-        for i in range(len(axes_to_stack.keys())):
-            image = image[None]
+            # copy each tile directly into its place in the stitched image. Missing tiles stay zero
+            stitched_shape, tiles_in_layout = tile_layout
+            # allocate with the singleton stacked dimensions in place so the result needs no reshaping
+            image = np.zeros((1,) * len(stacked_axes) + stitched_shape + self._empty_tile.shape[2:],
+                             dtype=self.dtype)
+            stitched_image = image[(0,) * len(stacked_axes)]
+            tile_coordinates = [{**axes, **axes_to_slice, _ROW_AXIS: row, _COLUMN_AXIS: column}
+                                for row, column, _ in tiles_in_layout]
+            tiles = self._read_images_batch(tile_coordinates)
+            for (_, _, destination), tile in zip(tiles_in_layout, tiles):
+                if tile is None:
+                    continue
+                if tile_crop is not None:
+                    tile = tile[tile_crop]
+                stitched_image[destination] = tile
+            return image
+        image = self._read_image_if_present({**axes, **axes_to_slice})
+        if image is None:
+            image = self._empty_tile
+        return image.reshape((1,) * len(stacked_axes) + image.shape)
+
+    def _read_image_stack_for_large_array(self, block_id, stacked_axes, axes_to_slice, images_per_chunk):
+        """
+        Read one chunk of data with several images along the last stacked axis
+        """
+        axes = {axis_name: positions[index] for (axis_name, positions), index in zip(stacked_axes[:-1], block_id)}
+        stack_axis_name, stack_axis_positions = stacked_axes[-1]
+        start = block_id[len(stacked_axes) - 1] * images_per_chunk
+        stack_positions = stack_axis_positions[start:start + images_per_chunk]
+        # missing images stay zero
+        image = np.zeros((1,) * (len(stacked_axes) - 1) + (len(stack_positions),) + self._empty_tile.shape,
+                         dtype=self.dtype)
+        stack = image[(0,) * (len(stacked_axes) - 1)]
+        stack_coordinates = [{**axes, **axes_to_slice, stack_axis_name: position} for position in stack_positions]
+        for stack_index, single_image in enumerate(self._read_images_batch(stack_coordinates)):
+            if single_image is not None:
+                stack[stack_index] = single_image
         return image
 
     ####### Private methods #######
 
+    def _read_images_batch(self, coordinates_list):
+        """
+        Read the images at each of the given image coordinates, with None for the ones not in the dataset.
+        Subclasses that can read several images at once faster than one at a time can override this
+        """
+        return self._map_tile_reads(self._read_image_if_present, coordinates_list)
+
+    def _map_tile_reads(self, read, items):
+        """
+        Apply a function that reads an image to each of the items, on the shared thread pool if this dataset's
+        reads can run in parallel
+        """
+        if self._parallel_tile_reads and len(items) > 1:
+            return _get_tile_read_executor().map(read, items)
+        return map(read, items)
+
+    def _read_image_if_present(self, coordinates):
+        """
+        Read the image at the given image coordinates, or return None if the dataset doesn't have it.
+        Subclasses can override this to look the image up once, rather than in has_image and again in read_image
+        """
+        if not self.has_image(**coordinates):
+            return None
+        return self.read_image(**coordinates)
+
+    def _update_empty_tile(self, h, w):
+        """
+        Make sure the zero tile used for missing images has the given size, only reallocating it when
+        the size or dtype changes. It is read-only because the same array is returned for every missing image
+        """
+        shape = (h, w) if self.bytes_per_pixel != 3 else (h, w, 3)
+        if self._empty_tile is None or self._empty_tile.shape != shape or self._empty_tile.dtype != self.dtype:
+            self._empty_tile = np.zeros(shape, self.dtype)
+            self._empty_tile.flags.writeable = False
+
+    def _notify_new_image(self):
+        # setting an Event takes its lock even when it is already set, which is the usual case when images
+        # arrive faster than anyone calls await_new_image
+        if not self._new_image_event.is_set():
+            self._new_image_event.set()
+
     def _infer_image_properties(self, image):
         if self.dtype is None:
             # infer global dtype for as_array method
@@ -584,6 +776,14 @@ class NDStorageBase(NDStorageAPI):
         """
         A new image has been added to the dataset, update the axes values and types
         """
+        # steady state: every axis and position has been seen before (as a value of the axis' type, since e.g.
+        # True == 1), so there is nothing to check or add
+        axes_types = self.axes_types
+        if image_coordinates.keys() == self.axes.keys() and \
+                all(type(position) is axes_types[axis_name] and position in self.axes[axis_name]
+                    for axis_name, position in image_coordinates.items()):
+            return
+
         # update and ensure that all axes are either string or integer
         for axis_name, position in image_coordinates.items():
             if axis_name not in self.axes_types:
@@ -599,7 +799,7 @@ class NDStorageBase(NDStorageAPI):
         # update the axes that have been seen
         for axis_name in image_coordinates.keys():
             if axis_name not in self.axes.keys():
-                self.axes[axis_name] = SortedSet()
+                self.axes[axis_name] = _AxisPositions()
                 self.axes_types[axis_name] = type(image_coordinates[axis_name])
             self.axes[axis_name].add(image_coordinates[axis_name])
 
@@ -620,6 +820,7 @@ class NDStorageBase(NDStorageAPI):
                                  self.axes_types[axis_name] is str]:
             if string_axis_name not in self._string_axes_values.keys():
                 self._string_axes_values[string_axis_name] = []
+                self._string_axes_value_sets[string_axis_name] = set()
 
         # if its called on just one image, make it a list of one image
         if isinstance(image_coordinates, dict):
@@ -627,21 +828,37 @@ class NDStorageBase(NDStorageAPI):
 
         for single_image_coordinates in image_coordinates:
             for axis_name, axis_value in single_image_coordinates:
-                if axis_name in self._string_axes_values.keys() and \
-                        axis_value not in self._string_axes_values[axis_name]:
+                if axis_name in self._string_axes_value_sets.keys() and \
+                        axis_value not in self._string_axes_value_sets[axis_name]:
                     self._string_axes_values[axis_name].append(axis_value)
+                    self._string_axes_value_sets[axis_name].add(axis_value)
 
 
     def _parse_image_keys(self, image_keys):
         """
         Parse the image keys to determine the axes names, types, and possible values
         """
+        # gather the positions of every axis first, so that each axis is built from a whole set at once. Many
+        # images share each (axis, position) pair, so the distinct pairs are found with one set union
+        positions_by_axis = collections.defaultdict(set)
+        for axis_name, position in set().union(*image_keys):
+            positions_by_axis[axis_name].add(position)
+        # keep axes in the order they are first seen in, which decides the order of axes with equal sort keys.
+        # Usually the first image has all of them
+        axis_names = {}
         for image_coordinates in image_keys:
-            for axis_name, position in image_coordinates:
-                if axis_name not in self.axes.keys():
-                    self.axes[axis_name] = SortedSet()
-                    self.axes_types[axis_name] = type(position)
-                self.axes[axis_name].add(position)
+            if len(axis_names) == len(positions_by_axis):
+                break
+            for axis_name, _ in image_coordinates:
+                axis_names[axis_name] = None
+        for axis_name in axis_names:
+            positions = positions_by_axis[axis_name]
+            if axis_name not in self.axes:
+                self.axes_types[axis_name] = type(next(iter(positions)))
+                self.axes[axis_name] = _AxisPositions(positions)
+            else:
+                for position in positions:
+                    self.axes[axis_name].add(position)
         # Sort axes according to _AXIS_ORDER
         self.axes = dict(sorted(self.axes.items(), key=_get_axis_order_key, reverse=True))
 
@@ -656,13 +873,27 @@ class NDStorageBase(NDStorageAPI):
             channel = kwargs['channel_name']
             del kwargs['channel_name']
 
-        axis_positions = {'channel': channel, 'z': z, 'position': position,
-                    'time': time, 'row': row, 'column': column, **kwargs}
-        # ignore ones that are None
-        axis_positions = {n: axis_positions[n] for n in axis_positions.keys() if axis_positions[n] is not None}
-        for axis_name in axis_positions.keys():
+        # ignore ones that are None. Tested one at a time, rather than building a dict of every axis and then
+        # filtering it, since this is called for every image read
+        axis_positions = {}
+        if channel is not None:
+            axis_positions['channel'] = channel
+        if z is not None:
+            axis_positions['z'] = z
+        if position is not None:
+            axis_positions['position'] = position
+        if time is not None:
+            axis_positions['time'] = time
+        if row is not None:
+            axis_positions['row'] = row
+        if column is not None:
+            axis_positions['column'] = column
+        for axis_name, axis_position in kwargs.items():
+            if axis_position is not None:
+                axis_positions[axis_name] = axis_position
+        for axis_name, axis_position in axis_positions.items():
             # convert any string-valued axes passed as ints into strings
-            if self.axes_types[axis_name] == str and type(axis_positions[axis_name]) == int:
-                axis_positions[axis_name] = self._string_axes_values[axis_name][axis_positions[axis_name]]
+            if self.axes_types[axis_name] == str and type(axis_position) == int:
+                axis_positions[axis_name] = self._string_axes_values[axis_name][axis_position]
 
         return axis_positions
@@ -13,12 +13,13 @@ from ndstorage.ndtiff_index import NDTiffIndexEntry, read_ndtiff_index
 
 from ndstorage.ndtiff_file import SingleNDTiffWriter, MAJOR_VERSION, MINOR_VERSION
 
-from ndstorage.ndstorage_base import WritableNDStorageAPI, NDStorageBase
+from ndstorage.ndstorage_base import WritableNDStorageAPI, NDStorageBase, _axes_memo_key, _KEY_MEMO_SIZE
 
 class NDTiffDataset(NDStorageBase, WritableNDStorageAPI):
     """
     Class that opens a single NDTiff dataset
     """
+    _parallel_tile_reads = True
 
     def __init__(self, dataset_path=None, file_io: NDTiffFileIO = BUILTIN_FILE_IO, summary_metadata=None,
                  name=None, writable=False, **kwargs):
@@ -43,6 +44,10 @@ class NDTiffDataset(NDStorageBase, WritableNDStorageAPI):
 
         self.file_io = file_io
         self._lock = threading.RLock()
+        # callers (e.g. viewers and dask arrays) tend to request the same coordinates repeatedly, so keys are
+        # memoized on the arguments they were built from (in a dict, an lru_cache of a bound method would be a
+        # reference cycle)
+        self._key_memo = {}
         if writable:
             self.major_version = MAJOR_VERSION
             self.minor_version = MINOR_VERSION
@@ -60,6 +65,8 @@ class NDTiffDataset(NDStorageBase, WritableNDStorageAPI):
             self.name = name
             self._write_pending_images = {}
             self._finished_event = threading.Event()
+            # channel names are added as images arrive
+            self._channels = {}
 
             if writable and name is not None:
                 # create a folder to hold the new Tiff files
@@ -77,29 +84,18 @@ class NDTiffDataset(NDStorageBase, WritableNDStorageAPI):
                 data = index_file.read()
                 self.index = read_ndtiff_index(data)
 
-            tiff_names = [
-                self.file_io.path_join(self.path, tiff) for tiff in self.file_io.listdir(self.path) if tiff.endswith(".tif")
-            ]
-            self._readers_by_filename = {}
+            # only the first file is opened up front, for the summary metadata and version. The others are opened
+            # when an image in them is first read, so opening a large dataset to read a few images is fast
+            tiff_names = [entry.name for entry in self.file_io.scandir(self.path) if entry.name.endswith(".tif")]
+            self._readers_by_filename = _LazyReaders(self.path, self.file_io)
             self.summary_metadata = {}
             self.major_version, self.minor_version = (0, 0)
-            # Count how many files need to be opened
-            num_tiffs = 0
-            count = 0
-            for file in self.file_io.listdir(self.path):
-                if file.endswith(".tif"):
-                    num_tiffs += 1
-            # populate list of readers and tree mapping indices to readers
-            for tiff in tiff_names:
-                print("\rOpening file {} of {}...".format(count + 1, num_tiffs), end="")
-                count += 1
-                new_reader = SingleNDTiffReader(tiff, file_io=self.file_io)
-                self._readers_by_filename[tiff.split(os.sep)[-1]] = new_reader
-                # Should be the same on every file so resetting them is fine
-                self.major_version, self.minor_version = new_reader.major_version, new_reader.minor_version
-
-            if len(self._readers_by_filename) > 0:
-                self.summary_metadata = list(self._readers_by_filename.values())[0].summary_md
+            if len(tiff_names) > 0:
+                print("\rOpening files...          ", end="")
+                first_reader = self._readers_by_filename[min(tiff_names)]
+                self.summary_metadata = first_reader.summary_md
+                # Should be the same on every file
+                self.major_version, self.minor_version = first_reader.major_version, first_reader.minor_version
 
             # TODO: make overlap non-public in a future version
             self.overlap = (
@@ -117,7 +113,7 @@ class NDTiffDataset(NDStorageBase, WritableNDStorageAPI):
             # (which is not necessarily true but convenient when it is)
             if len(self.index) > 0:
                 with self._lock:
-                    first_index = list(self.index.values())[0]
+                    first_index = next(iter(self.index.values()))
                 self._parse_essential_image_metadata(first_index)
 
             print("\rDataset opened                ")
@@ -135,34 +131,39 @@ class NDTiffDataset(NDStorageBase, WritableNDStorageAPI):
         return list(self._channels.keys())
 
     def has_image(self, channel=None, z=None, time=None, position=None, row=None, column=None, **kwargs):
-        with self._lock:
-            axes = self._consolidate_axes(channel, z, position, time, row, column, **kwargs)
+        # no lock, since viewers call this for every tile. Each dict lookup is atomic, and put_image adds an image
+        # to the index before removing it from the pending images, so an image being written is always in one of them
+        key = self._key_from_axes(channel, z, position, time, row, column, **kwargs)
 
-            if self._write_pending_images is not None and len(self._write_pending_images) > 0:
-                if frozenset(axes.items()) in self._write_pending_images:
-                    return True
+        if self._write_pending_images is not None and len(self._write_pending_images) > 0:
+            if key in self._write_pending_images:
+                return True
 
-            return self._does_have_image(axes)
+        return self._does_have_image(key)
 
     def read_image(self, channel=None, z=None, time=None, position=None, row=None, column=None, **kwargs):
         with self._lock:
-            axes = self._consolidate_axes(channel, z, position, time, row, column, **kwargs)
+            key = self._key_from_axes(channel, z, position, time, row, column, **kwargs)
 
             if self._write_pending_images is not None and len(self._write_pending_images) > 0:
-                if frozenset(axes.items()) in self._write_pending_images:
-                    return self._write_pending_images[frozenset(axes.items())][0]
+                pending = self._write_pending_images.get(key)
+                if pending is not None:
+                    return pending[0]
 
-            return self._do_read_image(axes)
+        # read outside the lock so that several threads (e.g. computing a dask array) can read at once
+        return self._do_read_image(key)
 
     def read_metadata(self, channel=None, z=None, time=None, position=None, row=None, column=None, **kwargs):
         with self._lock:
-            axes = self._consolidate_axes(channel, z, position, time, row, column, **kwargs)
+            key = self._key_from_axes(channel, z, position, time, row, column, **kwargs)
 
             if self._write_pending_images is not None and len(self._write_pending_images) > 0:
-                if frozenset(axes.items()) in self._write_pending_images:
-                    return self._write_pending_images[frozenset(axes.items())][1]
+                pending = self._write_pending_images.get(key)
+                if pending is not None:
+                    return pending[1]
 
-            return self._do_read_metadata(axes)
+        # read outside the lock so that several threads (e.g. computing a dask array) can read at once
+        return self._do_read_metadata(key)
 
     def put_image(self, coordinates, image, metadata):
         if not self._writable:
@@ -176,7 +177,7 @@ class NDTiffDataset(NDStorageBase, WritableNDStorageAPI):
         self._infer_image_properties(image)
 
         # Update viewer as soon as image is ready in RAM
-        self._new_image_event.set()
+        self._notify_new_image()
 
         # Create a new file if needed
         if self.current_writer is None:
@@ -222,9 +223,8 @@ class NDTiffDataset(NDStorageBase, WritableNDStorageAPI):
         return self._finished_event.wait(timeout=timeout)
 
     def get_image_coordinates_list(self):
-        frozen_set_list = list(self.index.keys())
-        # convert to dict
-        return [{axis_name: position for axis_name, position in key} for key in frozen_set_list]
+        # index keys are frozensets of (axis_name, position) pairs
+        return [dict(key) for key in list(self.index)]
 
     # TODO: remove this in a future version
     def get_index_keys(self):
@@ -234,6 +234,16 @@ class NDTiffDataset(NDStorageBase, WritableNDStorageAPI):
         warnings.warn("get_index_keys is deprecated, use get_image_coordinates_list instead", DeprecationWarning)
         return self.get_image_coordinates_list()
 
+    def has_new_image(self):
+        """
+        For datasets currently being acquired, check whether a new image has arrived since this function
+        was last called, so that a viewer displaying the data can be updated.
+        """
+        if not self._new_image_event.is_set():
+            return False
+        self._new_image_event.clear()
+        return True
+
     def add_index_entry(self, data, new_image_updates=True):
         """
         Add entry for an image that has been received and is now on disk
@@ -246,28 +256,37 @@ class NDTiffDataset(NDStorageBase, WritableNDStorageAPI):
         new_image_updates : bool
             whether to signal that a new image is ready
         """
-        with self._lock:
-            if isinstance(data, NDTiffIndexEntry):
-                index_entry = data
-                # reconvert to dict from frozenset
-                image_coordinates = {axis_name: position for axis_name, position in index_entry.axes_key}
-                self.index[index_entry.axes_key] = index_entry
-            else:
-                _, image_coordinates, index_entry = NDTiffIndexEntry.unpack_single_index_entry(data)
-                self.index[frozenset(image_coordinates.items())] = index_entry
+        # the entry is parsed and a new file opened before taking the lock, so that reads by other threads
+        # (e.g. a viewer during an acquisition) are held up only while the entry is added
+        if isinstance(data, NDTiffIndexEntry):
+            index_entry = data
+            # reconvert to dict from frozenset
+            image_coordinates = {axis_name: position for axis_name, position in index_entry.axes_key}
+        else:
+            _, image_coordinates, index_entry = NDTiffIndexEntry.unpack_single_index_entry(data)
+        new_reader = None
+        if index_entry.filename not in self._readers_by_filename:
+            # the file may still be being written (by this dataset or by the Java side), so it isn't memory mapped
+            new_reader = SingleNDTiffReader(os.path.join(self.path, index_entry.filename), file_io=self.file_io,
+                                            memory_map=False)
 
-            if index_entry.filename not in self._readers_by_filename:
-                new_reader = SingleNDTiffReader(os.path.join(self.path, index_entry.filename), file_io=self.file_io)
-                self._readers_by_filename[index_entry.filename] = new_reader
-                # Should be the same on every file so resetting them is fine
-                self.major_version, self.minor_version = new_reader.major_version, new_reader.minor_version
+        with self._lock:
+            if new_reader is not None:
+                if index_entry.filename in self._readers_by_filename:
+                    # another thread opened it first
+                    new_reader.close()
+                else:
+                    self._readers_by_filename[index_entry.filename] = new_reader
+                    # Should be the same on every file so resetting them is fine
+                    self.major_version, self.minor_version = new_reader.major_version, new_reader.minor_version
+            self.index[frozenset(image_coordinates.items())] = index_entry
 
             self._parse_essential_image_metadata(index_entry)
 
             if new_image_updates:
                 self._update_axes(image_coordinates)
                 self._update_channel_names(image_coordinates)
-                self._new_image_event.set()
+                self._notify_new_image()
 
 
 
@@ -283,23 +302,30 @@ class NDTiffDataset(NDStorageBase, WritableNDStorageAPI):
         """
         # iterate through the key_combos for each image
         if self.major_version >= 3 and self.minor_version >= 2:
-            if _CHANNEL_AXIS in self._string_axes_values:
-                self._channels = {name: self._string_axes_values[_CHANNEL_AXIS].index(name)
-                                  for name in self._string_axes_values[_CHANNEL_AXIS]}
+            channel_names = self._string_axes_values.get(_CHANNEL_AXIS)
+            # the list of names only grows, so it only needs converting when a name has been added
+            if channel_names is not None and len(channel_names) != len(self._channels):
+                self._channels = {name: i for i, name in enumerate(channel_names)}
         else:
             # before string-valued axes were allowed in NDTiff 3.1
             if 'ChNames' in self.summary_metadata:
                 # It was created by a MM MDA/Clojure acquistiion engine
-                self._channels = {name: i for i, name in enumerate(self.summary_metadata['ChNames'])}
+                if len(self._channels) != len(self.summary_metadata['ChNames']):
+                    self._channels = {name: i for i, name in enumerate(self.summary_metadata['ChNames'])}
             else:
-                # AcqEngJ
-                if _CHANNEL_AXIS in self.axes.keys():
-                    for key in self.index.keys():
+                # AcqEngJ. Channel names are read from image metadata, until every channel has a name
+                if _CHANNEL_AXIS in self.axes.keys() and len(self._channels) < len(self.axes[_CHANNEL_AXIS]):
+                    # a channel can only be new in a newly added image, so only that image needs checking
+                    keys = [frozenset(image_coordinates.items())] if isinstance(image_coordinates, dict) \
+                        else self.index.keys()
+                    named_channels = set(self._channels.values())
+                    for key in keys:
                         single_image_coordinates = {axis: position for axis, position in key}
                         if (_CHANNEL_AXIS in single_image_coordinates.keys()
-                                    and single_image_coordinates[_CHANNEL_AXIS] not in self._channels.values()):
+                                    and single_image_coordinates[_CHANNEL_AXIS] not in named_channels):
                             channel_name = self.read_metadata(**single_image_coordinates)["Channel"]
                             self._channels[channel_name] = single_image_coordinates[_CHANNEL_AXIS]
+                            named_channels.add(single_image_coordinates[_CHANNEL_AXIS])
                         if len(self._channels.values()) == len(self.axes[_CHANNEL_AXIS]):
                             break
 
@@ -332,42 +358,140 @@ class NDTiffDataset(NDStorageBase, WritableNDStorageAPI):
             self.image_width = index_entry["image_width"]
             self.image_height = index_entry["image_height"]
 
-    def _does_have_image(self, axes):
-        key = frozenset(axes.items())
+    def _key_from_axes(self, channel, z, position, time, row, column, **kwargs):
+        """
+        Get the index key (frozenset of axis names and positions) for the given axis positions, memoized on the
+        raw arguments
+        """
+        if 'channel_name' in kwargs:
+            # deprecated alias, let _consolidate_axes warn every time
+            return frozenset(self._consolidate_axes(channel, z, position, time, row, column, **kwargs).items())
+        other_axes = tuple(sorted(kwargs.items()))
+        memo_key = _axes_memo_key(channel, z, position, time, row, column, other_axes)
+        key = self._key_memo.get(memo_key)
+        if key is None:
+            key = self._key_from_axes_uncached(channel, z, position, time, row, column, other_axes)
+            if len(self._key_memo) >= _KEY_MEMO_SIZE:
+                self._key_memo.clear()
+            self._key_memo[memo_key] = key
+        return key
+
+    def _key_from_coordinates(self, coordinates):
+        return self._key_from_axes(**{'channel': None, 'z': None, 'position': None, 'time': None,
+                                      'row': None, 'column': None, **coordinates})
+
+    def _key_from_axes_uncached(self, channel, z, position, time, row, column, other_axes):
+        # string axis values are only ever appended, so a key stays valid as more images are added
+        return frozenset(self._consolidate_axes(channel, z, position, time, row, column, **dict(other_axes)).items())
+
+    def _does_have_image(self, key):
         return key in self.index
 
-    def _do_read_image(self, axes,):
+    def _do_read_image(self, key):
         # determine which reader contains the image
-        key = frozenset(axes.items())
-        if key not in self.index:
-            raise Exception("image with keys {} not present in data set".format(key))
-        index = self.index[key]
-        reader = self._readers_by_filename[index["filename"]]
+        index, reader = self._find_image(key)
         return reader.read_image(index)
 
-    def _do_read_metadata(self, axes):
+    def _read_images_batch(self, coordinates_list):
+        # look up every image under a single acquisition of the lock, so the reads that follow need neither the
+        # lock nor a key lookup. Readers are looked up after it is released, since that may open a file. The OS
+        # is asked to start reading every tile up front, so it can read them from disk concurrently rather than
+        # one at a time as each is needed
+        lookups = []
+        with self._lock:
+            for coordinates in coordinates_list:
+                key = self._key_from_coordinates(coordinates)
+                pending = self._write_pending_images.get(key) if self._write_pending_images else None
+                if pending is not None:
+                    lookups.append((pending[0], None))
+                    continue
+                lookups.append((None, self.index.get(key)))
+        for i, (_, index_entry) in enumerate(lookups):
+            if index_entry is not None:
+                reader = self._readers_by_filename[index_entry.filename]
+                reader.prefetch_image(index_entry)
+                lookups[i] = (reader, index_entry)
+        return self._map_tile_reads(_read_looked_up_image, lookups)
+
+    def _read_image_if_present(self, coordinates):
+        with self._lock:
+            key = self._key_from_coordinates(coordinates)
+            if self._write_pending_images is not None and len(self._write_pending_images) > 0:
+                pending = self._write_pending_images.get(key)
+                if pending is not None:
+                    return pending[0]
+            index_entry = self.index.get(key)
+        if index_entry is None:
+            return None
+        # outside the lock, since this may open the file
+        return self._readers_by_filename[index_entry.filename].read_image(index_entry)
+
+    def _do_read_metadata(self, key):
         """
 
         Parameters
         ----------
-        axes : dict
+        key : frozenset
+            index key of the image
 
         Returns
         -------
         image_metadata
         """
-        key = frozenset(axes.items())
-        if key not in self.index:
-            raise Exception("image with keys {} not present in data set".format(key))
-        index = self.index[key]
-        reader = self._readers_by_filename[index["filename"]]
+        index, reader = self._find_image(key)
         return reader.read_metadata(index)
 
+    def _find_image(self, key):
+        """
+        Get the index entry of an image and the reader of the file it is in
+        """
+        with self._lock:
+            index = self.index.get(key)
+        if index is None:
+            raise Exception("image with keys {} not present in data set".format(key))
+        # the reader is looked up outside the lock, since that may open the file. A reader is always added before
+        # the index entries of its file
+        return index, self._readers_by_filename[index["filename"]]
+
     def close(self):
-        for reader in self._readers_by_filename.values():
+        for reader in list(self._readers_by_filename.values()):
             reader.close()
 
 
+class _LazyReaders(dict):
+    """
+    SingleNDTiffReaders keyed by file name, each one opened the first time it is looked up
+    """
+
+    def __init__(self, path, file_io):
+        super().__init__()
+        self._path = path
+        self._file_io = file_io
+        self._lock = threading.Lock()
+
+    def __missing__(self, filename):
+        with self._lock:
+            # another thread may have opened it while this one was waiting
+            reader = self.get(filename)
+            if reader is None:
+                # files of a dataset read from disk are finished, so they can be memory mapped
+                reader = SingleNDTiffReader(self._file_io.path_join(self._path, filename), file_io=self._file_io,
+                                            memory_map=True)
+                self[filename] = reader
+            return reader
+
+
+
+def _read_looked_up_image(lookup):
+    """
+    Read an image found by NDTiffDataset._read_images_batch, given as either a reader and index entry, or an
+    image (None if it is missing) and None
+    """
+    reader_or_image, index_entry = lookup
+    if index_entry is None:
+        return reader_or_image
+    return reader_or_image.read_image(index_entry)
+
 
 def _create_unique_acq_dir(root, prefix):
     if not os.path.exists(root):
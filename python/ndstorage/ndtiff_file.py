@@ -2,15 +2,18 @@ import numpy as np
 import sys
 import json
 import os
+import mmap
+import functools
+import threading
 import time
 import struct
 import warnings
 from collections import OrderedDict
 from io import BytesIO
 from ndstorage.file_io import NDTiffFileIO, BUILTIN_FILE_IO
+from ndstorage import _json
 from ndstorage.ndtiff_index import NDTiffIndexEntry
 
-from collections import deque
 from concurrent.futures import ThreadPoolExecutor
 
 MAJOR_VERSION = 3
@@ -39,6 +42,20 @@ MM_METADATA = 51123
 
 SUMMARY_MD_HEADER = 2355492
 
+_U32 = struct.Struct('<I')
+# extra handles a reader may open to each file for reads from several threads at once
+_MAX_SPARE_FILES = min(4, os.cpu_count() or 1) - 1
+# byte order mark, TIFF magic number, first IFD offset, identifier, major and minor version,
+# summary metadata header and summary metadata length
+_FILE_HEADER = struct.Struct('<HHIIIIII')
+# for reading file headers, which must be in the byte order of this machine
+_NATIVE_U16 = struct.Struct('=H')
+_NATIVE_U32 = struct.Struct('=I')
+_NATIVE_U32_PAIR = struct.Struct('=II')
+# Layout of the block written before each image's pixels: number of entries, the IFD entries (tag, type, count,
+# value), offset of the next IFD, bits per sample of each channel (RGB only), and the x and y resolutions
+_IFD_BLOCK = struct.Struct('<H' + 'HHII' * ENTRIES_PER_IFD + 'I' + 'IIII')
+_RGB_IFD_BLOCK = struct.Struct('<H' + 'HHII' * ENTRIES_PER_IFD + 'I' + 'HHH' + 'IIII')
 
 _POSITION_AXIS = "position"
 _ROW_AXIS = "row"
@@ -51,28 +68,24 @@ class SingleNDTiffWriter:
 
     def __init__(self, directory, filename, summary_md):
         self.filename = os.path.join(directory, filename)
+        # name of the file stored in each index entry
+        self._basename = os.path.basename(self.filename)
         self.index_map = {}
         self.next_ifd_offset_location = -1
         self.res_numerator = 1
         self.res_denominator = 1
         self.z_step_um = 1
-        self.buffers = deque()
         self.first_ifd = True
+        # scratch buffers for the IFD block of mono and RGB images
+        self._ifd_buffers = {False: bytearray(_IFD_BLOCK.size), True: bytearray(_RGB_IFD_BLOCK.size)}
+        self._bytes_per_image_pixels_cache = {}
 
         self.start_time = None
 
         os.makedirs(directory, exist_ok=True)
-        # pre-allocate the file
-        file_path = os.path.join(directory, filename)
-        with open(file_path, 'wb') as f:
-            f.seek(MAX_FILE_SIZE - 1)
-            f.write(b'\0')
-            f.flush()
-
-        # reopen the file in binary mode
-        self.file = open(file_path, 'rb+')
-        # reset position to 0
-        self.file.seek(0)
+        # the file is not preallocated, it grows as images are written. Where os.writev isn't available, a large
+        # buffer collects the write() calls for each image, which is then flushed to the file at once
+        self.file = open(self.filename, 'wb+', buffering=1 << 20)
 
         self._write_mm_header_and_summary_md(summary_md)
         self.reader = SingleNDTiffReader(self.filename, summary_md=summary_md)
@@ -93,27 +106,16 @@ class SingleNDTiffWriter:
     def _write_mm_header_and_summary_md(self, summary_md):
         summary_md_bytes = self._get_bytes_from_string(json.dumps(summary_md))
         md_length = len(summary_md_bytes)
-        header_buffer = bytearray(28)
 
-        # 8 bytes for file header
-        if sys.byteorder == 'big':
-            struct.pack_into('>H', header_buffer, 0, 0x4D4D)
-        else:
-            struct.pack_into('<H', header_buffer, 0, 0x4949)
-        struct.pack_into('<H', header_buffer, 2, 42)
+        # 28 bytes of file header, packed in one call. The byte order marks are palindromes,
+        # so they come out the same when packed little-endian
+        byte_order_mark = 0x4D4D if sys.byteorder == 'big' else 0x4949
         first_ifd_offset = 28 + md_length
         if first_ifd_offset % 2 == 1:
             first_ifd_offset += 1  # Start first IFD on a word
-        struct.pack_into('<I', header_buffer, 4, first_ifd_offset)
-
-        # 12 bytes for unique identifier and major version
-        struct.pack_into('<III', header_buffer, 8, 483729, MAJOR_VERSION, MINOR_VERSION)
-
-        # 8 bytes for summaryMD header and summary md length
-        struct.pack_into('<II', header_buffer, 20, SUMMARY_MD_HEADER, md_length)
-
-        for buffer in [header_buffer, summary_md_bytes]:
-            self.file.write(buffer)
+        header = _FILE_HEADER.pack(byte_order_mark, 42, first_ifd_offset, 483729, MAJOR_VERSION, MINOR_VERSION,
+                                   SUMMARY_MD_HEADER, md_length)
+        self.file.write(header + summary_md_bytes)
 
     def _get_bytes_from_string(self, s):
         return s.encode('utf-8')
@@ -126,7 +128,7 @@ class SingleNDTiffWriter:
 
     def _write_null_offset_after_last_image(self):
         buffer = bytearray(4)
-        struct.pack_into('<I', buffer, 0, 0)
+        _U32.pack_into(buffer, 0, 0)
         current_pos = self.file.tell()
         self.file.seek(self.next_ifd_offset_location)
         self.file.write(buffer)
@@ -152,36 +154,70 @@ class SingleNDTiffWriter:
         NDTiffIndexEntry
             The index entry for the image
         """
-        image_height, image_width = pixels.shape
+        image_height, image_width = pixels.shape[:2]
         rgb = pixels.ndim == 3 and pixels.shape[2] == 3
         if bit_depth == 'auto':
             bit_depth = 8 if pixels.dtype == np.uint8 else 16
         # if metadata is a dict, serialize it to a json string and make it a utf8 byte buffer
         if isinstance(metadata, dict):
             metadata = self._get_bytes_from_string(json.dumps(metadata))
-        ied = self._write_ifd(index_key, pixels, metadata, rgb, image_height, image_width, bit_depth)
-        while self.buffers:
-            self.file.write(self.buffers.popleft())
+        ied, buffers = self._write_ifd(index_key, pixels, metadata, rgb, image_height, image_width, bit_depth)
+        self._write_buffers(buffers)
         self.index_map[index_key] = ied
         return ied
 
+    def _write_buffers(self, buffers):
+        """
+        Write the buffers (IFD, pixels, metadata) at the current file position, with a single writev system call
+        on platforms that have one
+        """
+        if not hasattr(os, 'writev'):
+            for buffer in buffers:
+                self.file.write(buffer)
+            # the image is read by readers with their own handles as soon as write_image returns, so it (and the
+            # file header before it) can't be left in the file object's buffer
+            self.file.flush()
+            return
+        views = [memoryview(buffer).cast('B') for buffer in buffers]
+        total_bytes = sum(view.nbytes for view in views)
+        # write through the file descriptor, so anything buffered by the file object has to go first
+        self.file.flush()
+        position = self.file.tell()
+        fd = self.file.fileno()
+        os.lseek(fd, position, os.SEEK_SET)
+        written = os.writev(fd, views)
+        while True:
+            # writev can return before writing everything, so continue from where it stopped
+            while views and written >= views[0].nbytes:
+                written -= views[0].nbytes
+                views.pop(0)
+            if not views:
+                break
+            views[0] = views[0][written:]
+            written = os.writev(fd, views)
+        # move the file object to where the descriptor now is
+        self.file.seek(position + total_bytes)
+
 
     def _write_ifd(self, index_key, pixels, metadata, rgb, image_height, image_width, bit_depth):
-        if self.file.tell() % 2 == 1:
-            self.file.seek(self.file.tell() + 1)  # Make IFD start on word
+        ifd_offset = self.file.tell()
+        # Make IFD start on word, by writing a padding byte in front of it
+        padding = ifd_offset % 2
+        ifd_offset += padding
 
-        byte_depth = 1 if isinstance(pixels, bytearray) else 2
+        byte_depth = 1 if rgb or isinstance(pixels, bytearray) else 2
         bytes_per_image_pixels = self._bytes_per_image_pixels(pixels, rgb)
         num_entries = 13
 
         # 2 bytes for number of directory entries, 12 bytes per directory entry, 4 byte offset of next IFD
         # 6 bytes for bits per sample if RGB, 16 bytes for x and y resolution, 1 byte per character of MD string
         # number of bytes for pixels
-        ifd_and_bit_depth_bytes = 2 + num_entries * 12 + 4 + (6 if rgb else 0) + 16
-        ifd_and_small_vals_buffer = bytearray(ifd_and_bit_depth_bytes)
+        # (the scratch buffer is reused for every image: it is completely overwritten below and written to the file
+        # before write_image returns)
+        ifd_and_small_vals_buffer = self._ifd_buffers[rgb]
 
         # Needed to reset to zero after last IFD
-        self.next_ifd_offset_location = self.file.tell() + 2 + num_entries * 12
+        self.next_ifd_offset_location = ifd_offset + 2 + num_entries * 12
         bits_per_sample_offset = self.next_ifd_offset_location + 4
         x_resolution_offset = bits_per_sample_offset + (6 if rgb else 0)
         y_resolution_offset = x_resolution_offset + 8
@@ -192,85 +228,71 @@ class SingleNDTiffWriter:
         if next_ifd_offset % 2 == 1:
             next_ifd_offset += 1  # Make IFD start on word
 
-        buffer_position = 0
-        struct.pack_into('<H', ifd_and_small_vals_buffer, buffer_position, num_entries)
-        buffer_position += 2
-
-        buffer_position += self._write_ifd_entry(ifd_and_small_vals_buffer, WIDTH, 4, 1, image_width, buffer_position)
-        buffer_position += self._write_ifd_entry(ifd_and_small_vals_buffer, HEIGHT, 4, 1, image_height, buffer_position)
-        buffer_position += self._write_ifd_entry(ifd_and_small_vals_buffer, BITS_PER_SAMPLE, 3, 3 if rgb else 1,
-                                                 bits_per_sample_offset if rgb else byte_depth * 8, buffer_position)
-        buffer_position += self._write_ifd_entry(ifd_and_small_vals_buffer, COMPRESSION, 3, 1, 1, buffer_position)
-        buffer_position += self._write_ifd_entry(ifd_and_small_vals_buffer, PHOTOMETRIC_INTERPRETATION, 3, 1,
-                                                 2 if rgb else 1, buffer_position)
-        buffer_position += self._write_ifd_entry(ifd_and_small_vals_buffer, STRIP_OFFSETS, 4, 1, pixel_data_offset,
-                                                 buffer_position)
-        buffer_position += self._write_ifd_entry(ifd_and_small_vals_buffer, SAMPLES_PER_PIXEL, 3, 1, 3 if rgb else 1,
-                                                 buffer_position)
-        buffer_position += self._write_ifd_entry(ifd_and_small_vals_buffer, ROWS_PER_STRIP, 3, 1, image_height,
-                                                 buffer_position)
-        buffer_position += self._write_ifd_entry(ifd_and_small_vals_buffer, STRIP_BYTE_COUNTS, 4, 1,
-                                                 bytes_per_image_pixels, buffer_position)
-        buffer_position += self._write_ifd_entry(ifd_and_small_vals_buffer, X_RESOLUTION, 5, 1, x_resolution_offset,
-                                                 buffer_position)
-        buffer_position += self._write_ifd_entry(ifd_and_small_vals_buffer, Y_RESOLUTION, 5, 1, y_resolution_offset,
-                                                 buffer_position)
-        buffer_position += self._write_ifd_entry(ifd_and_small_vals_buffer, RESOLUTION_UNIT, 3, 1, 3, buffer_position)
-        buffer_position += self._write_ifd_entry(ifd_and_small_vals_buffer, MM_METADATA, 2, len(metadata),
-                                                 metadata_offset, buffer_position)
-
-        struct.pack_into('<I', ifd_and_small_vals_buffer, buffer_position, next_ifd_offset)
-        buffer_position += 4
-
+        ifd_values = [
+            num_entries,
+            WIDTH, 4, 1, image_width,
+            HEIGHT, 4, 1, image_height,
+            BITS_PER_SAMPLE, 3, 3 if rgb else 1, bits_per_sample_offset if rgb else byte_depth * 8,
+            COMPRESSION, 3, 1, 1,
+            PHOTOMETRIC_INTERPRETATION, 3, 1, 2 if rgb else 1,
+            STRIP_OFFSETS, 4, 1, pixel_data_offset,
+            SAMPLES_PER_PIXEL, 3, 1, 3 if rgb else 1,
+            ROWS_PER_STRIP, 3, 1, image_height,
+            STRIP_BYTE_COUNTS, 4, 1, bytes_per_image_pixels,
+            X_RESOLUTION, 5, 1, x_resolution_offset,
+            Y_RESOLUTION, 5, 1, y_resolution_offset,
+            RESOLUTION_UNIT, 3, 1, 3,
+            MM_METADATA, 2, len(metadata), metadata_offset,
+            next_ifd_offset]
         if rgb:
-            struct.pack_into('<HHH', ifd_and_small_vals_buffer, buffer_position, byte_depth * 8, byte_depth * 8,
-                             byte_depth * 8)
-            buffer_position += 6
-
-        struct.pack_into('<II', ifd_and_small_vals_buffer, buffer_position, self.res_numerator, self.res_denominator)
-        buffer_position += 8
-        struct.pack_into('<II', ifd_and_small_vals_buffer, buffer_position, self.res_numerator, self.res_denominator)
-        buffer_position += 8
+            ifd_values += [byte_depth * 8, byte_depth * 8, byte_depth * 8]
+        ifd_values += [self.res_numerator, self.res_denominator, self.res_numerator, self.res_denominator]
+        (_RGB_IFD_BLOCK if rgb else _IFD_BLOCK).pack_into(ifd_and_small_vals_buffer, 0, *ifd_values)
 
-        self.buffers.append(ifd_and_small_vals_buffer)
-        self.buffers.append(self._get_pixel_buffer(pixels, rgb))
-        self.buffers.append(metadata)
+        buffers = [ifd_and_small_vals_buffer, self._get_pixel_buffer(pixels, rgb), metadata]
+        if padding:
+            buffers.insert(0, b'\0')
 
         self.first_ifd = False
 
         # Return structured data for putting into the index entry
-        pixel_type = {
+        pixel_type = NDTiffIndexEntry.EIGHT_BIT_RGB if rgb else {
             8: NDTiffIndexEntry.EIGHT_BIT,
             10: NDTiffIndexEntry.TEN_BIT,
             12: NDTiffIndexEntry.TWELVE_BIT,
             14: NDTiffIndexEntry.FOURTEEN_BIT,
             16: NDTiffIndexEntry.SIXTEEN_BIT,
             11: NDTiffIndexEntry.ELEVEN_BIT
-        }.get(bit_depth, NDTiffIndexEntry.EIGHT_BIT_RGB if rgb else None)
+        }.get(bit_depth)
 
-        return NDTiffIndexEntry(index_key, pixel_type, pixel_data_offset, image_width, image_height, metadata_offset,
-                                len(metadata), self.filename.split(os.sep)[-1])
-
-    def _write_ifd_entry(self, buffer, tag, dtype, count, value, buffer_position):
-        struct.pack_into('<HHII', buffer, buffer_position, tag, dtype, count, value)
-        return 12
+        index_entry = NDTiffIndexEntry(index_key, pixel_type, pixel_data_offset, image_width, image_height,
+                                       metadata_offset, len(metadata), self._basename)
+        return index_entry, buffers
 
     def _get_pixel_buffer(self, pixels, rgb):
-        if rgb:
-            original_pix = pixels
-            rgb_pix = bytearray(len(original_pix) * 3 // 4)
-            num_pix = len(original_pix) // 4
-            for i in range(num_pix):
-                rgb_pix[i * 3] = original_pix[i * 4 + 2]
-                rgb_pix[i * 3 + 1] = original_pix[i * 4 + 1]
-                rgb_pix[i * 3 + 2] = original_pix[i * 4]
-            return rgb_pix
+        if isinstance(pixels, np.ndarray):
+            # flat byte view of the pixels that writev can use directly. Only arrays that aren't contiguous
+            # (e.g. slices of a larger array) are copied. RGB images (height x width x 3) are already in the
+            # order of the file
+            return memoryview(np.ascontiguousarray(pixels)).cast('B')
         else:
             return pixels
 
     def _bytes_per_image_pixels(self, pixels, rgb):
+        # images written to one file almost always have the same type and shape, and this is called twice for
+        # each image (has_space_to_write and _write_ifd)
+        if not isinstance(pixels, np.ndarray):
+            return self._compute_bytes_per_image_pixels(pixels, rgb)
+        key = (pixels.dtype, pixels.shape, rgb)
+        bytes_per_image_pixels = self._bytes_per_image_pixels_cache.get(key)
+        if bytes_per_image_pixels is None:
+            bytes_per_image_pixels = self._compute_bytes_per_image_pixels(pixels, rgb)
+            self._bytes_per_image_pixels_cache[key] = bytes_per_image_pixels
+        return bytes_per_image_pixels
+
+    def _compute_bytes_per_image_pixels(self, pixels, rgb):
         if rgb:
-            return len(pixels) * 3 // 4
+            return pixels.size
         else:
             if isinstance(pixels, bytearray):
                 return len(pixels)
@@ -300,7 +322,7 @@ class SingleNDTiffReader:
 
     UNCOMPRESSED = 0
 
-    def __init__(self, tiff_path, file_io: NDTiffFileIO = BUILTIN_FILE_IO, summary_md=None):
+    def __init__(self, tiff_path, file_io: NDTiffFileIO = BUILTIN_FILE_IO, summary_md=None, memory_map=False):
         """
         tiff_path: str
             The path to a .tiff file to load
@@ -308,10 +330,27 @@ class SingleNDTiffReader:
             A container containing various methods for interacting with files.
         summary_md: dict
             If not None, this corresponds to a file that is actively being written to by an associated writer
+        memory_map: bool
+            Whether to memory map the file for reading. Only for files that are no longer being written, since
+            a writer can't resize a mapped file on some platforms (e.g. Windows)
         """
         self.file_io = file_io
         self.tiff_path = tiff_path
         self.file = self.file_io.open(tiff_path, "rb")
+        # reads that aren't from the memory map use pread where available, which doesn't move a shared file
+        # position. Otherwise they seek and read the shared file object, which must not interleave, so threads
+        # that find it in use read from extra handles to the same file, opened as needed
+        self._fd = self._pread_file_descriptor()
+        self._file_lock = threading.Lock()
+        self._spare_files = []
+        # number of extra handles open, including ones in use
+        self._num_spare_files = 0
+        self._spare_files_lock = threading.Lock()
+        self._closed = False
+        self.mm = self._memory_map() if memory_map else None
+        # metadata of images is often read repeatedly (e.g. channel names, pixel sizes, stage positions)
+        # so its bytes are cached. The parsed metadata isn't, so that every caller gets a copy it can modify
+        self._cached_read_metadata_bytes = functools.lru_cache(maxsize=4096)(self._read_metadata_bytes)
         if summary_md is None:
             self.summary_md, self.first_ifd_offset = self._read_header()
         else:
@@ -321,7 +360,47 @@ class SingleNDTiffReader:
 
     def close(self):
         """ """
-        self.file.close()
+        self._cached_read_metadata_bytes.cache_clear()
+        if self.mm is not None:
+            try:
+                self.mm.close()
+            except BufferError:
+                # images returned by read_image are views of the mapping, it is unmapped once they are gone
+                pass
+        # not while another thread is reading the main handle, or has an extra one. Extra handles in use are
+        # closed when they are given back
+        with self._file_lock:
+            self.file.close()
+        with self._spare_files_lock:
+            self._closed = True
+            for spare_file in self._spare_files:
+                spare_file.close()
+            self._num_spare_files -= len(self._spare_files)
+            self._spare_files = []
+
+    def _pread_file_descriptor(self):
+        """
+        The file descriptor of the file for reading with os.pread, or None if the platform has no pread or the
+        file object has no descriptor
+        """
+        if not hasattr(os, 'pread'):
+            return None
+        try:
+            return self.file.fileno()
+        except (AttributeError, OSError, ValueError):
+            return None
+
+    def _memory_map(self):
+        """
+        Map the file into memory for reading with the file_io's mmap function, or return None if it has none
+        or the file object doesn't support it (e.g. a custom file_io that doesn't open local files)
+        """
+        if getattr(self.file_io, 'mmap', None) is None:
+            return None
+        try:
+            return self.file_io.mmap(self.file)
+        except (AttributeError, OSError, ValueError):
+            return None
 
     def _read_header(self):
         """
@@ -333,44 +412,124 @@ class SingleNDTiffReader:
         first_image_byte_offset : int
             int byte offset of first image IFD
         """
+        # the fixed size part of the header is read at once and the fields unpacked from it
+        header = self._read(0, 28)
         # read standard tiff header
-        if self._read(0, 2) == b"\x4d\x4d":
+        if header[0:2] == b"\x4d\x4d":
             # Big endian
             if sys.byteorder != "big":
                 raise Exception("Potential issue with mismatched endian-ness")
-        elif self._read(0, 2) == b"\x49\x49":
+        elif header[0:2] == b"\x49\x49":
             # little endian
             if sys.byteorder != "little":
                 raise Exception("Potential issue with mismatched endian-ness")
         else:
             raise Exception("Endian type not specified correctly")
-        if np.frombuffer(self._read(2,4), dtype=np.uint16)[0] != 42:
+        if _NATIVE_U16.unpack_from(header, 2)[0] != 42:
             raise Exception("Tiff magic 42 missing")
-        first_ifd_offset = np.frombuffer(self._read(4,8), dtype=np.uint32)[0]
+        first_ifd_offset = _NATIVE_U32.unpack_from(header, 4)[0]
 
         # read custom stuff: header, summary md
-        self.major_version = int.from_bytes(self._read(12, 16), sys.byteorder)
-        self.minor_version = int.from_bytes(self._read(16, 20), sys.byteorder)
+        # the writer always stores the version little-endian
+        self.major_version = _U32.unpack_from(header, 12)[0]
+        self.minor_version = _U32.unpack_from(header, 16)[0]
 
-        summary_md_header, summary_md_length = np.frombuffer(self._read(20, 28), dtype=np.uint32)
+        summary_md_header, summary_md_length = _NATIVE_U32_PAIR.unpack_from(header, 20)
         if summary_md_header != self.SUMMARY_MD_HEADER:
             raise Exception("Summary metadata header wrong")
-        summary_md = json.loads(self._read(28, 28 + summary_md_length))
+        summary_md = _json.loads(self._read(28, 28 + summary_md_length))
         return summary_md, first_ifd_offset
 
     def _read(self, start, end):
         """
         convert to python ints
         """
-        self.file.seek(int(start), 0)
-        return self.file.read(end - start)
+        if self.mm is not None and end <= len(self.mm):
+            return self.mm[int(start):int(end)]
+        if self._fd is not None:
+            return os.pread(self._fd, int(end - start), int(start))
+        if self._file_lock.acquire(blocking=False):
+            try:
+                self.file.seek(int(start), 0)
+                return self.file.read(end - start)
+            finally:
+                self._file_lock.release()
+        spare_file = self._take_spare_file()
+        if spare_file is None:
+            # as many handles as allowed are open, wait for the main one
+            with self._file_lock:
+                self.file.seek(int(start), 0)
+                return self.file.read(end - start)
+        try:
+            spare_file.seek(int(start), 0)
+            return spare_file.read(end - start)
+        finally:
+            self._give_back_spare_file(spare_file)
+
+    def _take_spare_file(self):
+        """
+        Get an extra handle to the file that no other thread is using, opening a new one if there are
+        fewer than _MAX_SPARE_FILES. Returns None if there are none free. It is given back with
+        _give_back_spare_file
+        """
+        with self._spare_files_lock:
+            if self._spare_files:
+                return self._spare_files.pop()
+            if self._closed or self._num_spare_files >= _MAX_SPARE_FILES:
+                return None
+            self._num_spare_files += 1
+        try:
+            return self.file_io.open(self.tiff_path, "rb")
+        except BaseException:
+            with self._spare_files_lock:
+                self._num_spare_files -= 1
+            raise
+
+    def _give_back_spare_file(self, spare_file):
+        with self._spare_files_lock:
+            if not self._closed:
+                self._spare_files.append(spare_file)
+                return
+            # the reader was closed while the handle was in use
+            self._num_spare_files -= 1
+        spare_file.close()
 
     def read_metadata(self, index):
-        return json.loads(
-            self._read(
-                index["metadata_offset"], index["metadata_offset"] + index["metadata_length"]
-            )
-        )
+        return _json.loads(self._cached_read_metadata_bytes(index["metadata_offset"], index["metadata_length"]))
+
+    def _read_metadata_bytes(self, metadata_offset, metadata_length):
+        return self._read(metadata_offset, metadata_offset + metadata_length)
+
+    def prefetch_image(self, index_entry):
+        """
+        Ask the OS to start reading the pixels of an image into memory in the background, so that a later
+        read_image doesn't wait on the disk. Requesting many images this way lets the OS read them concurrently.
+        The part of the image in the memory map is requested with madvise and any part past its end (in a file
+        still being written) with posix_fadvise. Does nothing where the platform has neither
+        """
+        if index_entry.pixel_type == self.EIGHT_BIT_RGB:
+            bytes_per_pixel = 3
+        elif index_entry.pixel_type == self.EIGHT_BIT_MONOCHROME:
+            bytes_per_pixel = 1
+        else:
+            bytes_per_pixel = 2
+        start = index_entry.pix_offset
+        end = start + index_entry.image_width * index_entry.image_height * bytes_per_pixel
+        if self.mm is not None and hasattr(mmap, 'MADV_WILLNEED'):
+            # madvise needs a page aligned start
+            mapped_start = start - start % mmap.PAGESIZE
+            mapped_end = min(end, len(self.mm))
+            if mapped_end > mapped_start:
+                try:
+                    self.mm.madvise(mmap.MADV_WILLNEED, mapped_start, mapped_end - mapped_start)
+                except (OSError, ValueError):
+                    pass
+            start = max(start, len(self.mm))
+        if end > start and self._fd is not None and hasattr(os, 'posix_fadvise'):
+            try:
+                os.posix_fadvise(self._fd, start, end - start, os.POSIX_FADV_WILLNEED)
+            except OSError:
+                pass
 
     def read_image(self, index_entry):
         if index_entry.pixel_type == self.EIGHT_BIT_RGB:
@@ -390,7 +549,13 @@ class SingleNDTiffReader:
             raise Exception("unrecognized pixel type")
         width = index_entry.image_width
         height = index_entry.image_height
-        data = self._read(index_entry.pix_offset, index_entry.pix_offset + width * height * bytes_per_pixel)
-        pixels = np.frombuffer(data, dtype=dtype)
+        end = index_entry.pix_offset + width * height * bytes_per_pixel
+        if self.mm is not None and end <= len(self.mm):
+            # view of the mapped file, no copy
+            pixels = np.frombuffer(self.mm, dtype=dtype, count=width * height * (3 if bytes_per_pixel == 3 else 1),
+                                   offset=index_entry.pix_offset)
+        else:
+            data = self._read(index_entry.pix_offset, end)
+            pixels = np.frombuffer(data, dtype=dtype)
         image = pixels.reshape([height, width, 3] if bytes_per_pixel == 3 else [height, width])
         return image
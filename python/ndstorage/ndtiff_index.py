@@ -3,20 +3,62 @@ import struct
 import warnings
 from collections import OrderedDict
 from io import BytesIO
+from ndstorage import _json
+
+_LENGTH = struct.Struct("I")
+# the fixed part of each entry: pixel offset, image width, image height, pixel type, pixel compression,
+# metadata offset, metadata length, metadata compression
+_FIXED_FIELDS = struct.Struct("IIIIIIII")
+_FIXED_FIELDS_SIZE = _FIXED_FIELDS.size
 
 def read_ndtiff_index(data, verbose=True):
-    index = {}
+    # find where the fields of each entry are, and decode its file name
+    unpack_length = _LENGTH.unpack_from
+    data_length = len(data)
+    axes_json = []
+    filenames = []
+    fixed_fields_offsets = []
+    filenames_by_bytes = {}
+    next_progress_report = 0
     position = 0
-    while position < len(data):
-        if verbose:
-            print("\rReading index... {:.1f}%       ".format(100 * (1 - (len(data) - position) / len(data))), end="")
-        entry = NDTiffIndexEntry.unpack_single_index_entry(data, position)
-        if entry is None:
-            break
-        position, axes, index_entry = entry
-        index[frozenset(axes.items())] = index_entry
-        if position is None:
+    while position < data_length:
+        if verbose and position >= next_progress_report:
+            print("\rReading index... {:.1f}%       ".format(100 * position / data_length), end="")
+            next_progress_report = position + data_length // 100
+        (axes_length,) = unpack_length(data, position)
+        if axes_length == 0:
+            warnings.warn(
+                "Index appears to not have been properly terminated (the dataset may still work)"
+            )
             break
+        axes_json.append(data[position + 4: position + 4 + axes_length])
+        position += axes_length + 4
+        (filename_length,) = unpack_length(data, position)
+        # all the images in a file have the same file name, so each distinct name is decoded once
+        filename_bytes = data[position + 4: position + 4 + filename_length]
+        filename = filenames_by_bytes.get(filename_bytes)
+        if filename is None:
+            filename = filenames_by_bytes[filename_bytes] = filename_bytes.decode("utf-8")
+        filenames.append(filename)
+        position += 4 + filename_length
+        if position + _FIXED_FIELDS_SIZE > data_length:
+            raise struct.error("Index entry is truncated")
+        fixed_fields_offsets.append(position)
+        position += _FIXED_FIELDS_SIZE
+
+    # then decode the axes of all entries at once, as one JSON array, rather than calling the parser per entry
+    all_axes = _json.loads(b"[" + b",".join(axes_json) + b"]") if axes_json else []
+
+    # the fixed fields are unpacked as each entry is made, so only one entry's are in memory at a time
+    unpack_fixed_fields = _FIXED_FIELDS.unpack_from
+    index = {}
+    for axes, filename, fixed_fields_offset in zip(all_axes, filenames, fixed_fields_offsets):
+        (pixel_offset, image_width, image_height, pixel_type, pixel_compression, metadata_offset, metadata_length,
+         metadata_compression) = unpack_fixed_fields(data, fixed_fields_offset)
+        # the entry shares the key rather than keeping the axes dict alive
+        index_key = frozenset(axes.items())
+        index[index_key] = NDTiffIndexEntry(index_key, pixel_type, pixel_offset, image_width, image_height,
+                                            metadata_offset, metadata_length, filename)
     return index
 
 
@@ -31,6 +73,10 @@ class NDTiffIndexEntry:
 
     UNCOMPRESSED = 0
 
+    # datasets can have millions of entries, so they have no per-instance __dict__
+    __slots__ = ('axes_key', 'pix_offset', 'image_width', 'image_height', 'metadata_length', 'metadata_offset',
+                 'pixel_type', 'pixel_compression', 'metadata_compression', 'filename', 'data_set_finished_entry')
+
     def __init__(self, axes_key, pixel_type, pix_offset, image_width, image_height, md_offset, md_length, filename):
         self.axes_key = axes_key
         self.pix_offset = pix_offset
@@ -101,7 +147,7 @@ class NDTiffIndexEntry:
             )
             return None
         axes_str = data[position + 4: position + 4 + axes_length].decode("utf-8")
-        axes = json.loads(axes_str)
+        axes = _json.loads(axes_str)
         position += axes_length + 4
         (filename_length,) = struct.unpack("I", data[position: position + 4])
         filename = data[position + 4: position + 4 + filename_length].decode("utf-8")
@@ -109,7 +155,7 @@ class NDTiffIndexEntry:
         pixel_offset, image_width, image_height, pixel_type, pixel_compression, \
             metadata_offset, metadata_length, metadata_compression = \
             struct.unpack("IIIIIIII", data[position: position + 32])
-        index_entry = NDTiffIndexEntry(axes.items, pixel_type, pixel_offset, image_width, image_height,
+        index_entry = NDTiffIndexEntry(frozenset(axes.items()), pixel_type, pixel_offset, image_width, image_height,
                                         metadata_offset, metadata_length, filename)
         position += 32
         return position, axes, index_entry
@@ -154,7 +200,7 @@ class NDTiffIndexEntry:
 
     @staticmethod
     def deserialize_axes(s):
-        return json.loads(s)
+        return _json.loads(s)
 
     @staticmethod
     def serialize_axes(axes):
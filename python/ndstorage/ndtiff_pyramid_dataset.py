@@ -1,6 +1,7 @@
 import os
 import numpy as np
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from ndstorage.file_io import NDTiffFileIO, BUILTIN_FILE_IO
 from ndstorage.ndtiff_dataset import NDTiffDataset
 
@@ -48,9 +49,7 @@ class NDTiffPyramidDataset:
         # Loading from disk
         self.path = dataset_path
         self.path += "" if self.path[-1] == os.sep else os.sep
-        res_dirs = [
-            dI for dI in self.file_io.listdir(dataset_path) if self.file_io.isdir(self.file_io.path_join(dataset_path, dI))
-        ]
+        res_dirs = [entry.name for entry in self.file_io.scandir(dataset_path) if entry.is_dir()]
         # map from downsample factor to dataset
         with self._lock:
             self.res_levels = {}
@@ -60,9 +59,13 @@ class NDTiffPyramidDataset:
                 "Couldn't find full resolution directory. Is this the correct path to a dataset?"
             )
 
-        for res_dir in res_dirs:
-            res_dir_path = self.file_io.path_join(dataset_path, res_dir)
-            res_level = NDTiffDataset(dataset_path=res_dir_path, file_io=self.file_io)
+        # opening a resolution level is I/O bound (directory scan, index and metadata reads), so open them all at once
+        res_dir_paths = [self.file_io.path_join(dataset_path, res_dir) for res_dir in res_dirs]
+        with ThreadPoolExecutor(max_workers=min(8, len(res_dir_paths))) as executor:
+            opened_res_levels = list(executor.map(
+                lambda res_dir_path: NDTiffDataset(dataset_path=res_dir_path, file_io=self.file_io), res_dir_paths))
+
+        for res_dir, res_level in zip(res_dirs, opened_res_levels):
             if res_dir == "Full resolution":
                 with self._lock:
                     self.res_levels[0] = res_level
@@ -85,8 +88,10 @@ class NDTiffPyramidDataset:
 
             else:
                 res_level._full_resolution = False
+                # e.g. 'Downsampled_x4' is level 2. bit_length gives floor(log2) exactly, without floats
+                downsample_factor = int(res_dir.split("x")[1])
                 with self._lock:
-                    self.res_levels[int(np.log2(int(res_dir.split("x")[1])))] = res_level
+                    self.res_levels[downsample_factor.bit_length() - 1] = res_level
 
         print("\rDataset Pyramid opened                ")
 
@@ -103,7 +108,7 @@ class NDTiffPyramidDataset:
         was last called, so that a viewer displaying the data can be updated.
         """
         # pass through to full resolution, since only this is monitored in current implementation
-        return self.res_levels[0]
+        return self.res_levels[0].has_new_image()
 
     def as_array(self, axes=None, stitched=False, res_level=None, **kwargs):
         """
@@ -137,21 +142,18 @@ class NDTiffPyramidDataset:
             """
             :param pixel_index: pixel index at relevant resolution
             """
-            negative_mask = pixel_index < 0
-            # positive
-            tile_index = pixel_index // tile_shape
-            # negative
-            tile_index[negative_mask] = (-1 - (np.abs(1 + pixel_index) // tile_shape))[negative_mask]
-            return tile_index
+            # floor division also rounds negative pixel indices down to the right tile
+            return np.floor_divide(pixel_index, tile_shape)
 
 
         if res_level is not None:
             return self.res_levels[res_level].as_array(axes=axes, stitched=stitched, **kwargs)
         else:
-            row_values = np.array(list(self.axes["row"]))
-            column_values = np.array(list(self.axes["column"]))
-            pixel_extent_min = np.array([np.min(row_values), np.min(column_values)]) * tile_shape
-            pixel_extent_max = np.array([np.max(row_values) + 1, np.max(column_values) + 1]) * tile_shape
+            # axis positions are kept sorted, so the first and last are the min and max
+            row_values = self.axes["row"]
+            column_values = self.axes["column"]
+            pixel_extent_min = np.array([row_values[0], column_values[0]]) * tile_shape
+            pixel_extent_max = np.array([row_values[-1] + 1, column_values[-1] + 1]) * tile_shape
             images = []
             for res_level in set(self.res_levels.keys()):
                 if res_level == 0:
@@ -220,16 +222,17 @@ class NDTiffPyramidDataset:
         bool :
             indicating whether the dataset has an image matching the specifications
         """
-        with self._lock:
-            return self.res_levels[resolution_level].has_image(
-                channel=channel,
-                z=z,
-                time=time,
-                position=position,
-                row=row,
-                column=column,
-                **kwargs
-            )
+        # each resolution level guards its own state, and the levels themselves don't change once the dataset is
+        # open, so reads of different levels (e.g. by a viewer of the pyramid) don't wait on one another
+        return self.res_levels[resolution_level].has_image(
+            channel=channel,
+            z=z,
+            time=time,
+            position=position,
+            row=row,
+            column=column,
+            **kwargs
+        )
 
     def read_image(
         self,
@@ -271,14 +274,15 @@ class NDTiffPyramidDataset:
             image as a 2D numpy array, or tuple with image and image metadata as dict
 
         """
-        with self._lock:
-            return self.res_levels[resolution_level].read_image(channel=channel,
-                    z=z,
-                    time=time,
-                    position=position,
-                    row=row,
-                    column=column,
-                    **kwargs)
+        return self.res_levels[resolution_level].read_image(
+            channel=channel,
+            z=z,
+            time=time,
+            position=position,
+            row=row,
+            column=column,
+            **kwargs
+        )
 
     def read_metadata(
         self,
@@ -319,15 +323,15 @@ class NDTiffPyramidDataset:
         metadata : dict
 
         """
-        with self._lock:
-            return self.res_levels[resolution_level].read_metadata(
-                    channel=channel,
-                    z=z,
-                    time=time,
-                    position=position,
-                    row=row,
-                    column=column,
-                    **kwargs)
+        return self.res_levels[resolution_level].read_metadata(
+            channel=channel,
+            z=z,
+            time=time,
+            position=position,
+            row=row,
+            column=column,
+            **kwargs
+        )
 
     # for backwards compatibility in case of older pycromanager version, can be removed in the future
     def _add_index_entry(self, index_entry):
@@ -339,5 +343,8 @@ class NDTiffPyramidDataset:
 
     def close(self):
         with self._lock:
-            for res_level in self.res_levels:
-                res_level.close()
+            if not self.res_levels:
+                return
+            # close the resolution levels concurrently, each one closes all of its files
+            with ThreadPoolExecutor(max_workers=len(self.res_levels)) as executor:
+                list(executor.map(lambda res_level: res_level.close(), self.res_levels.values()))
@@ -4,12 +4,13 @@ Library for reading multiresolution micro-magellan
 import os
 import numpy as np
 import sys
-import json
 import dask.array as da
 import warnings
 import struct
 import threading
+import functools
 from ndstorage.file_io import NDTiffFileIO, BUILTIN_FILE_IO
+from ndstorage import _json
 
 _POSITION_AXIS = "position"
 _ROW_AXIS = "row"
@@ -55,12 +56,54 @@ class _MultipageTiffReader:
         self.file_io = file_io
         self.tiff_path = tiff_path
         self.file = self.file_io.open(tiff_path, "rb")
+        # pixels are read as views of the mapped file rather than copied out of it. If the file is still
+        # being written, anything past the end of the mapping is read with seek/read
+        self.mm = self._memory_map()
+        # reads outside the mapping use pread where possible, which doesn't move the file position and so needs
+        # no lock or extra handle when threads read at once
+        self._fd = self._pread_file_descriptor()
+        # guards the file position when pread isn't available
+        self._file_lock = threading.Lock()
+        # metadata of images is often read repeatedly (e.g. by viewers), and the file doesn't change once written
+        # so its bytes are cached. The parsed metadata isn't, so that every caller gets a copy it can modify
+        self._cached_read_metadata_bytes = functools.lru_cache(maxsize=4096)(self._read_metadata_bytes)
         self.summary_md, self.first_ifd_offset = self._read_header()
 
     def close(self):
         """ """
+        self._cached_read_metadata_bytes.cache_clear()
+        if self.mm is not None:
+            try:
+                self.mm.close()
+            except BufferError:
+                # images returned by read_image are views of the mapping, it is unmapped once they are gone
+                pass
         self.file.close()
 
+    def _pread_file_descriptor(self):
+        """
+        The file descriptor of the file for reading with os.pread, or None if the platform has no pread or the
+        file object has no descriptor
+        """
+        if not hasattr(os, 'pread'):
+            return None
+        try:
+            return self.file.fileno()
+        except (AttributeError, OSError, ValueError):
+            return None
+
+    def _memory_map(self):
+        """
+        Map the file into memory for reading with the file_io's mmap function, or return None if it has none
+        or the file object doesn't support it
+        """
+        if getattr(self.file_io, 'mmap', None) is None:
+            return None
+        try:
+            return self.file_io.mmap(self.file)
+        except (AttributeError, OSError, ValueError):
+            return None
+
     def _read_header(self):
         """
         Returns
@@ -82,17 +125,18 @@ class _MultipageTiffReader:
                 raise Exception("Potential issue with mismatched endian-ness")
         else:
             raise Exception("Endian type not specified correctly")
-        if np.frombuffer(self._read(2,4), dtype=np.uint16)[0] != 42:
+        # the byte order was checked to be native above
+        if struct.unpack("=H", self._read(2,4))[0] != 42:
             raise Exception("Tiff magic 42 missing")
-        first_ifd_offset = np.frombuffer(self._read(4,8), dtype=np.uint32)[0]
+        first_ifd_offset = struct.unpack("=I", self._read(4,8))[0]
 
         # read custom stuff: header, summary md
         self._major_version = int.from_bytes(self._read(12,16), sys.byteorder)
 
-        summary_md_header, summary_md_length = np.frombuffer(self._read(16,24), dtype=np.uint32)
+        summary_md_header, summary_md_length = struct.unpack("=II", self._read(16,24))
         if summary_md_header != self.SUMMARY_MD_HEADER:
             raise Exception("Summary metadata header wrong")
-        summary_md = json.loads(self._read(24, 24 + summary_md_length))
+        summary_md = _json.loads(self._read(24, 24 + summary_md_length))
         return summary_md, first_ifd_offset
 
     def __enter__(self):
@@ -105,15 +149,19 @@ class _MultipageTiffReader:
         """
         convert to python ints
         """
-        self.file.seek(int(start), 0)
-        return self.file.read(end - start)
+        if self.mm is not None and end <= len(self.mm):
+            return self.mm[int(start):int(end)]
+        if self._fd is not None:
+            return os.pread(self._fd, int(end - start), int(start))
+        with self._file_lock:
+            self.file.seek(int(start), 0)
+            return self.file.read(end - start)
 
     def read_metadata(self, index):
-        return json.loads(
-            self._read(
-                index["metadata_offset"], index["metadata_offset"] + index["metadata_length"]
-            )
-        )
+        return _json.loads(self._cached_read_metadata_bytes(index["metadata_offset"], index["metadata_length"]))
+
+    def _read_metadata_bytes(self, metadata_offset, metadata_length):
+        return self._read(metadata_offset, metadata_offset + metadata_length)
 
     def read_image(self, index):
         if index["pixel_type"] == self.EIGHT_BIT_RGB:
@@ -130,12 +178,14 @@ class _MultipageTiffReader:
         width = index["image_width"]
         height = index["image_height"]
 
-        image = np.reshape(
-            np.frombuffer(self._read(
-            index["pixel_offset"], index["pixel_offset"] + width * height * bytes_per_pixel)
-                , dtype=dtype),
-            [height, width, 3] if bytes_per_pixel == 3 else [height, width],
-        )
+        end = index["pixel_offset"] + width * height * bytes_per_pixel
+        if self.mm is not None and end <= len(self.mm):
+            # view of the mapped file, no copy
+            pixels = np.frombuffer(self.mm, dtype=dtype, count=width * height * (3 if bytes_per_pixel == 3 else 1),
+                                   offset=index["pixel_offset"])
+        else:
+            pixels = np.frombuffer(self._read(index["pixel_offset"], end), dtype=dtype)
+        image = np.reshape(pixels, [height, width, 3] if bytes_per_pixel == 3 else [height, width])
         return image
 
 
@@ -168,7 +218,7 @@ class _ResolutionLevel:
                 print("\rOpening file {} of {}...".format(count + 1, max_count), end="")
                 count += 1
                 self._readers_by_filename[tiff.split(os.sep)[-1]] = _MultipageTiffReader(tiff, file_io=self.file_io)
-            self.summary_metadata = list(self._readers_by_filename.values())[0].summary_md
+            self.summary_metadata = next(iter(self._readers_by_filename.values())).summary_md
 
     def has_image(self, axes):
         key = frozenset(axes.items())
@@ -179,12 +229,15 @@ class _ResolutionLevel:
         Manually add a single index entry
         :param data: bytes object of a single index entry
         """
-        _, axes, index_entry = self.read_single_index_entry(data, self.index)
+        new_entries = {}
+        _, axes, index_entry = self.read_single_index_entry(data, new_entries)
 
         if index_entry["filename"] not in self._readers_by_filename:
             self._readers_by_filename[index_entry["filename"]] = _MultipageTiffReader(
                 self.path_root + index_entry["filename"], file_io=self.file_io
             )
+        # only added to the index once its file has a reader, since reads don't take a lock
+        self.index.update(new_entries)
         return axes, index_entry
 
     def read_single_index_entry(self, data, entries, position=0):
@@ -196,7 +249,7 @@ class _ResolutionLevel:
             )
             return None
         axes_str = data[position + 4 : position + 4 + axes_length].decode("utf-8")
-        axes = json.loads(axes_str)
+        axes = _json.loads(axes_str)
         position += axes_length + 4
         (filename_length,) = struct.unpack("I", data[position : position + 4])
         index_entry["filename"] = data[position + 4 : position + 4 + filename_length].decode(
@@ -223,13 +276,12 @@ class _ResolutionLevel:
             data = index_file.read()
         entries = {}
         position = 0
+        # only report progress about every 1%, rather than for every entry
+        next_progress_report = 0
         while position < len(data):
-            print(
-                "\rReading index... {:.1f}%       ".format(
-                    100 * (1 - (len(data) - position) / len(data))
-                ),
-                end="",
-            )
+            if position >= next_progress_report:
+                print("\rReading index... {:.1f}%       ".format(100 * position / len(data)), end="")
+                next_progress_report = position + len(data) // 100
             entry = self.read_single_index_entry(data, entries, position)
             if entry is None:
                 break
@@ -309,6 +361,8 @@ class NDTiff_v2_0():
         self.file_io = file_io
         self._tile_width = None
         self._tile_height = None
+        # reads don't take this lock, each file reader guards its own file position. It is for changes to the
+        # dataset as a whole
         self._lock = threading.Lock()
         if remote_storage_monitor is not None:
             # this dataset is a view of an active acquisiiton. The storage exists on the java side
@@ -403,24 +457,26 @@ class NDTiff_v2_0():
         # get information about image width and height, assuming that they are consistent for whole dataset
         # (which isn't strictly neccesary)
         with self._lock:
-            first_index = list(self.res_levels[0].index.values())[0]
+            first_index = next(iter(self.res_levels[0].index.values()))
         self._parse_first_index(first_index)
 
         print("\rDataset opened                ")
 
     def _read_channel_names(self):
         if _CHANNEL_AXIS in self.axes.keys():
-            self._channel_names = {}
+            # built separately and then swapped in, since reads look names up without taking _lock
+            channel_names = {}
             for key in self.res_levels[0].index.keys():
                 axes = {axis: position for axis, position in key}
                 if (
                     _CHANNEL_AXIS in axes.keys()
-                    and axes[_CHANNEL_AXIS] not in self._channel_names.values()
+                    and axes[_CHANNEL_AXIS] not in channel_names.values()
                 ):
                     channel_name = self.res_levels[0].read_metadata(axes)["Channel"]
-                    self._channel_names[channel_name] = axes[_CHANNEL_AXIS]
-                if len(self._channel_names.values()) == len(self.axes[_CHANNEL_AXIS]):
+                    channel_names[channel_name] = axes[_CHANNEL_AXIS]
+                if len(channel_names.values()) == len(self.axes[_CHANNEL_AXIS]):
                     break
+            self._channel_names = channel_names
 
     def _parse_first_index(self, first_index):
         """
@@ -626,10 +682,9 @@ class NDTiff_v2_0():
         bool :
             indicating whether the dataset has an image matching the specifications
         """
-        with self._lock:
-            return self.res_levels[0].has_image(
-                self._consolidate_axes(channel, channel_name, z, position, time, row, col, kwargs)
-            )
+        return self.res_levels[0].has_image(
+            self._consolidate_axes(channel, channel_name, z, position, time, row, col, kwargs)
+        )
 
     def read_image(
         self,
@@ -674,13 +729,11 @@ class NDTiff_v2_0():
             image as a 2D numpy array, or tuple with image and image metadata as dict
 
         """
-        with self._lock:
-            axes = self._consolidate_axes(
-                channel, channel_name, z, position, time, row, col, kwargs
-            )
-
-            res_level = self.res_levels[resolution_level]
-            return res_level.read_image(axes)
+        axes = self._consolidate_axes(
+            channel, channel_name, z, position, time, row, col, kwargs
+        )
+        res_level = self.res_levels[resolution_level]
+        return res_level.read_image(axes)
 
     def read_metadata(
         self,
@@ -724,13 +777,11 @@ class NDTiff_v2_0():
         metadata : dict
 
         """
-        with self._lock:
-            axes = self._consolidate_axes(
-                channel, channel_name, z, position, time, row, col, kwargs
-            )
-
-            res_level = self.res_levels[resolution_level]
-            return res_level.read_metadata(axes)
+        axes = self._consolidate_axes(
+            channel, channel_name, z, position, time, row, col, kwargs
+        )
+        res_level = self.res_levels[resolution_level]
+        return res_level.read_metadata(axes)
 
     def close(self):
         with self._lock:
@@ -8,7 +8,7 @@ import json
 import dask.array as da
 import warnings
 import struct
-from ndstorage.file_io import NDTiffFileIO, BUILTIN_FILE_IO
+from ndstorage.file_io import NDTiffFileIO, BUILTIN_FILE_IO, BUILTIN_MMAP
 
 class _MultipageTiffReader:
     # Class corresponsing to a single multipage tiff file in a Micro-Magellan dataset. Pass the full path of the TIFF to
@@ -44,6 +44,10 @@ class _MultipageTiffReader:
         self.file_io = file_io
         self.tiff_path = tiff_path
         self.file = open(tiff_path, "rb")
+        # pixels are read as views of the mapped file rather than copied out of it
+        self.mm = self._memory_map()
+        # reads outside the mapping use pread where possible, which doesn't move the file position
+        self._fd = self._pread_file_descriptor()
         self.summary_md, self.index_tree, self.first_ifd_offset = self._read_header()
 
         # get important metadata fields
@@ -58,8 +62,39 @@ class _MultipageTiffReader:
 
     def close(self):
         """ """
+        if self.mm is not None:
+            try:
+                self.mm.close()
+            except BufferError:
+                # a read in another thread is copying from the mapping, it is unmapped once that is done
+                pass
         self.file.close()
 
+    def _pread_file_descriptor(self):
+        """
+        The file descriptor of the file for reading with os.pread, or None if the platform has no pread or the
+        file object has no descriptor
+        """
+        if not hasattr(os, 'pread'):
+            return None
+        try:
+            return self.file.fileno()
+        except (AttributeError, OSError, ValueError):
+            return None
+
+    def _memory_map(self):
+        """
+        Map the file into memory for reading, or return None if the file_io has no mmap function (i.e. mapping
+        is turned off) or the file can't be mapped. The file is opened with the builtin open, so it is mapped
+        with the builtin mmap
+        """
+        if getattr(self.file_io, 'mmap', None) is None:
+            return None
+        try:
+            return BUILTIN_MMAP(self.file)
+        except (OSError, ValueError):
+            return None
+
     def _read_header(self):
         """
         Returns
@@ -81,26 +116,24 @@ class _MultipageTiffReader:
                 raise Exception("Potential issue with mismatched endian-ness")
         else:
             raise Exception("Endian type not specified correctly")
-        if np.frombuffer(self._read(2,4), dtype=np.uint16)[0] != 42:
+        # the byte order was checked to be native above
+        if struct.unpack("=H", self._read(2,4))[0] != 42:
             raise Exception("Tiff magic 42 missing")
-        first_ifd_offset = np.frombuffer(self._read(4,8), dtype=np.uint32)[0]
+        first_ifd_offset = struct.unpack("=I", self._read(4,8))[0]
 
         # read custom stuff: summary md, index map
-        index_map_offset_header, index_map_offset = np.frombuffer(
-            self._read(8, 16), dtype=np.uint32
-        )
+        index_map_offset_header, index_map_offset = struct.unpack("=II", self._read(8, 16))
         if index_map_offset_header != self.INDEX_MAP_OFFSET_HEADER:
             raise Exception("Index map offset header wrong")
         # int.from_bytes(self._read[24:28], sys.byteorder) # should be equal to 483729 starting in version 1
         self._major_version = int.from_bytes(self._read(28,32), sys.byteorder)
 
-        summary_md_header, summary_md_length = np.frombuffer(self._read(32,40), dtype=np.uint32)
+        summary_md_header, summary_md_length = struct.unpack("=II", self._read(32,40))
         if summary_md_header != self.SUMMARY_MD_HEADER:
             raise Exception("Index map offset header wrong")
         summary_md = json.loads(self._read(40 , 40 + summary_md_length))
-        index_map_header, index_map_length = np.frombuffer(
-            self._read(40 + summary_md_length, 48 + summary_md_length), dtype=np.uint32
-        )
+        index_map_header, index_map_length = struct.unpack(
+            "=II", self._read(40 + summary_md_length, 48 + summary_md_length))
         if index_map_header != self.INDEX_MAP_HEADER:
             raise Exception("Index map header incorrect")
         # get index map as nested list of ints
@@ -159,6 +192,10 @@ class _MultipageTiffReader:
         """
         convert to python ints
         """
+        if self.mm is not None and end <= len(self.mm):
+            return self.mm[int(start):int(end)]
+        if self._fd is not None:
+            return os.pread(self._fd, int(end - start), int(start))
         self.file.seek(int(start), 0)
         return self.file.read(end - start)
 
@@ -237,13 +274,18 @@ class _MultipageTiffReader:
     ):
         ifd_offset, pixels_offset = self.index_tree[channel_index][z_index][t_index][pos_index]
         bytes_per_pixel = (3 if self.rgb else 1) * (2 if self.dtype == np.uint16 else 1)
+        end = pixels_offset + self.width * self.height * bytes_per_pixel
+        if self.mm is not None and end <= len(self.mm):
+            # copied straight out of the mapped file
+            pixels = np.frombuffer(self.mm, dtype=self.dtype, count=self.width * self.height * (3 if self.rgb else 1),
+                                   offset=pixels_offset)
+        else:
+            pixels = np.frombuffer(self._read(pixels_offset, end), dtype=self.dtype)
+        # returned images are writable and independent of the file
         image = np.reshape(
-            np.frombuffer(self._read(
-            pixels_offset, pixels_offset + self.width * self.height * bytes_per_pixel)
-                , dtype=self.dtype),
+            pixels,
             [self.height, self.width, 3] if bytes_per_pixel == 3 else [self.height, self.width],
-        )
-        image = np.copy(image)
+        ).copy()
         # image = self._read_pixels(ifd_data['pixel_offset'], ifd_data['bytes_per_image'], memmapped)
         if read_metadata:
             ifd_data = self._read_ifd(ifd_offset)
@@ -649,6 +691,8 @@ class NDTiff_v1():
         self._empty_tile = (
             np.zeros((h, w), self.dtype) if not self.rgb else np.zeros((h, w, 3), self.dtype)
         )
+        if not stitched:
+            return self._as_lazy_array(verbose)
         self._count = 1
         total = np.prod([len(v) for v in self.axes.values()])
 
@@ -744,6 +788,29 @@ class NDTiff_v1():
             print("\rDask array opened")
         return array
 
+    def _as_lazy_array(self, verbose):
+        """
+        Make a dask array with one chunk per image, each read only when that chunk is computed
+        """
+        axis_names = list(self.axes.keys())
+        axis_positions = [list(self.axes[axis_name]) for axis_name in axis_names]
+
+        def read_block(block_id):
+            point_axes = {axis_name: positions[index]
+                          for axis_name, positions, index in zip(axis_names, axis_positions, block_id)}
+            image = self.read_image(**point_axes) if self.has_image(**point_axes) else self._empty_tile
+            return image.reshape((1,) * len(axis_names) + image.shape)
+
+        array = da.map_blocks(
+            read_block,
+            dtype=self.dtype,
+            chunks=tuple((1,) * len(positions) for positions in axis_positions) + self._empty_tile.shape,
+            meta=self._empty_tile
+        )
+        if verbose:
+            print("\rDask array opened")
+        return array
+
     def _convert_to_storage_axes(self, axes, channel_name=None):
         """Convert an abitrary set of axes to cztp axes as in the underlying storage
 
@@ -16,6 +16,15 @@ def test_v2_data_axis_sorting(test_data_path):
     data = dataset.as_array(axes=None)
     assert data.shape[:-2] == (num_timepoints, num_channels)
 
+def test_v2_modified_metadata_not_cached(test_data_path):
+    data_path = os.path.join(test_data_path, "v2", "ndtiffv2.0_test")
+    dataset = Dataset(data_path)
+    coordinates = dataset.get_index_keys()[0]
+    metadata = dataset.read_metadata(**coordinates)
+    original_axes = dict(metadata['Axes'])
+    metadata['Axes']['time'] = -1
+    assert dataset.read_metadata(**coordinates)['Axes'] == original_axes
+
 def test_v3_data(test_data_path):
     data_path = os.path.join(test_data_path, 'v3', 'ndtiffv3.0_test')
     dataset = Dataset(data_path)
@@ -26,7 +35,7 @@ def test_v3_data(test_data_path):
 def test_v2_stitched_data(test_data_path):
     data_path = os.path.join(test_data_path, "v2", "ndtiffv2.0_stitched_test")
     dataset = Dataset(data_path)
-    stitched = np.array(dataset.as_array(stitched=True))
+    stitched = np.asarray(dataset.as_array(stitched=True))
     assert(stitched[..., 0, 0] > 0)
     assert(stitched[..., -1, -1] > 0)
     assert(stitched[..., 0, -1] == 0)
@@ -35,31 +44,53 @@ def test_v2_stitched_data(test_data_path):
 def test_v3_stitched_data(test_data_path):
     data_path = os.path.join(test_data_path, 'v3', 'ndtiffv3.0_stitched_test')
     dataset = Dataset(data_path)
-    stitched = np.array(dataset.as_array(stitched=True, res_level=0))
+    stitched = np.asarray(dataset.as_array(stitched=True, res_level=0))
     assert(stitched[..., 0, 0] > 0)
     assert(stitched[..., -1, -1] > 0)
     assert(stitched[..., 0, -1] == 0)
     assert(stitched[..., -1, 0] == 0)
 
+def test_v3_stitched_data_close(test_data_path):
+    data_path = os.path.join(test_data_path, 'v3', 'ndtiffv3.0_stitched_test')
+    dataset = Dataset(data_path)
+    assert len(dataset.res_levels) > 1
+    readers = []
+    for res_level in dataset.res_levels.values():
+        # open the files of every level, not just the first one of each
+        for coordinates in res_level.get_image_coordinates_list():
+            res_level.read_image(**coordinates)
+        readers.extend(res_level._readers_by_filename.values())
+    assert len(readers) >= len(dataset.res_levels)
+    dataset.close()
+    assert all(reader.file.closed for reader in readers)
+
 def test_v3_magellan_explore(test_data_path):
     data_path = os.path.join(test_data_path, 'v3', 'Magellan_expolore_multi_channel')
     dataset = Dataset(data_path)
-    stitched = np.array(dataset.as_array(stitched=True, res_level=0))
+    stitched = np.asarray(dataset.as_array(stitched=True, res_level=0))
 
 def test_v3_magellan_explore_negative_and_overwritten(test_data_path):
     data_path = os.path.join(test_data_path, 'v3', 'Magellan_expolore_negative_indices_and_overwritten')
     dataset = Dataset(data_path)
-    stitched = np.array(dataset.as_array(stitched=True, res_level=0))
+    stitched = np.asarray(dataset.as_array(stitched=True, res_level=0))
 
 def test_v3_non_ctzp_axes(test_data_path):
     data_path = os.path.join(test_data_path, 'v3', 'Nonstandard_axis_names')
     dataset = Dataset(data_path)
-    stitched = np.array(dataset.as_array())
+    stitched = np.asarray(dataset.as_array())
 
 def test_v3_mm_mda(test_data_path):
     data_path = os.path.join(test_data_path, 'v3', 'mm_mda_tcz_15')
     dataset = Dataset(data_path)
-    stitched = np.array(dataset.as_array())
+    stitched = np.asarray(dataset.as_array())
+
+def test_v3_mm_mda_chunked(test_data_path):
+    # several images per chunk must give the same data as one image per chunk, including a partial last chunk
+    data_path = os.path.join(test_data_path, 'v3', 'mm_mda_tcz_15')
+    dataset = Dataset(data_path)
+    expected = np.asarray(dataset.as_array())
+    for chunks in ('auto', 3):
+        assert np.array_equal(np.asarray(dataset.as_array(chunks=chunks)), expected)
 
 def test_v3_2_multichannel(test_data_path):
     data_path = os.path.join(test_data_path, 'v3', 'ndtiff3.2_multichannel')
@@ -77,6 +108,15 @@ def test_v3_2_multichannel_axis_sorting(test_data_path):
     data = dataset.as_array(axes=None)
     assert data.shape[:-2] == (num_timepoints, num_channels, num_slices)
 
+def test_v3_2_modified_metadata_not_cached(test_data_path):
+    data_path = os.path.join(test_data_path, 'v3', 'ndtiff3.2_multichannel')
+    dataset = Dataset(data_path)
+    coordinates = dataset.get_image_coordinates_list()[0]
+    metadata = dataset.read_metadata(**coordinates)
+    original_axes = dict(metadata['Axes'])
+    metadata['Axes']['time'] = -1
+    assert dataset.read_metadata(**coordinates)['Axes'] == original_axes
+
 def test_v3_2_monochrome(test_data_path):
     data_path = os.path.join(test_data_path, 'v3', 'ndtiff3.2_monochrome')
     dataset = Dataset(data_path)
@@ -85,7 +125,7 @@ def test_v3_2_monochrome(test_data_path):
 def test_v3_2_magellan_rgb_explore(test_data_path):
     data_path = os.path.join(test_data_path, 'v3', 'ndtiff3.2_magellan_explore_rgb')
     dataset = Dataset(data_path)
-    assert(np.sum(np.array(dataset.as_array(stitched=True)[0])) > 0)
+    assert(np.sum(np.asarray(dataset.as_array(stitched=True)[0])) > 0)
 
 def test_v3_2_11bit_data(test_data_path):
     data_path = os.path.join(test_data_path, 'v3', 'ndtiff3.2_11bit_1')
@@ -101,12 +141,12 @@ def test_v3_2_12bit_pycromanager_data(test_data_path):
 def test_v3_2_no_magellan_explore_channels(test_data_path):
     data_path = os.path.join(test_data_path, 'v3', 'no_magellan_explore_multi_channel')
     dataset = Dataset(data_path)
-    assert(np.sum(np.array(dataset.as_array(stitched=True)[0])) > 0)
+    assert(np.sum(np.asarray(dataset.as_array(stitched=True)[0])) > 0)
 
 def test_v3_2_no_magellan_explore_no_channels(test_data_path):
     data_path = os.path.join(test_data_path, 'v3', 'no_magellan_explore_no_channel')
     dataset = Dataset(data_path)
-    assert(np.sum(np.array(dataset.as_array(stitched=True)[0])) > 0)
+    assert(np.sum(np.asarray(dataset.as_array(stitched=True)[0])) > 0)
 
 def test_labeled_positions(test_data_path):
     """
@@ -140,9 +180,7 @@ def test_labeled_positions(test_data_path):
         assert metadata['PositionName'] == position_name
 
     # Check that data is in the ('Pos0', 'Pos1', 'Pos2') order
-    pixel_00 = (1, 2, 0)
-    for idx, image in enumerate(data):
-        assert image[0, 0] == pixel_00[idx]
+    assert np.array_equal(data[:, 0, 0], np.array([1, 2, 0], dtype=data.dtype))
 
 def test_unordered_z_axis(test_data_path):
     """
@@ -168,7 +206,7 @@ def test_unordered_z_axis(test_data_path):
 
     data_path = os.path.join(test_data_path, 'v3', 'unordered_z_1')
     acquisition_z_axis = list(range(10)) + list(range(-10, 0))
-    sorting_index = np.argsort(acquisition_z_axis)
+    sorting_index = np.argsort(acquisition_z_axis, kind='stable')
     sorted_z_axis = np.sort(acquisition_z_axis)
 
     dataset = Dataset(data_path)
@@ -179,6 +217,4 @@ def test_unordered_z_axis(test_data_path):
     assert dataset.axes['z'] == set(sorted_z_axis)
 
     # Check that data is in the sorted(acquisition_z_axis) order
-    pixel_00 = sorting_index
-    for idx, image in enumerate(data):
-        assert image[0, 0] == pixel_00[idx]
+    assert np.array_equal(data[:, 0, 0], np.asarray(sorting_index, dtype=data.dtype))
@@ -3,6 +3,9 @@ from ndstorage import Dataset, file_io
 import os
 import pytest
 from typing import List
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from ndstorage.ndtiff_file import _MAX_SPARE_FILES
 
 class BadOpenError(Exception):
     pass
@@ -54,4 +57,107 @@ def test_bad_open(test_data_path):
         with pytest.raises(BadPathJoinError):
             Dataset(data_path, file_io=file_io.NDTiffFileIO(listdir_function=bad_path_join))
         with pytest.raises(BadIsDirError):
-            Dataset(data_path, file_io=file_io.NDTiffFileIO(listdir_function=bad_isdir))
\ No newline at end of file
+            Dataset(data_path, file_io=file_io.NDTiffFileIO(listdir_function=bad_isdir))
+
+
+def test_no_mmap(test_data_path):
+    # with no mmap function files are read with seek/read, which must give the same data
+    data_path = os.path.join(test_data_path, 'v3', 'ndtiff3.2_multichannel')
+    mapped = Dataset(data_path)
+    unmapped = Dataset(data_path, file_io=file_io.NDTiffFileIO(mmap_function=None))
+    for coordinates in mapped.get_image_coordinates_list():
+        assert np.array_equal(mapped.read_image(**coordinates), unmapped.read_image(**coordinates))
+        assert mapped.read_metadata(**coordinates) == unmapped.read_metadata(**coordinates)
+    mapped.close()
+    unmapped.close()
+
+
+class NoDescriptorFile:
+    """
+    A file without a file descriptor, so it can't be read with pread, keeping track of the files opened
+    """
+    opened = []
+
+    def __init__(self, path, mode):
+        self._file = open(path, mode)
+        NoDescriptorFile.opened.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def seek(self, *args):
+        return self._file.seek(*args)
+
+    def read(self, *args):
+        return self._file.read(*args)
+
+    def close(self):
+        self._file.close()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+
+def test_spare_file_handles(test_data_path):
+    # threads reading at once with seek/read use extra handles to each file, which are all closed with the dataset
+    data_path = os.path.join(test_data_path, 'v3', 'ndtiff3.2_multichannel')
+    NoDescriptorFile.opened = []
+    dataset = Dataset(data_path, file_io=file_io.NDTiffFileIO(open_function=NoDescriptorFile, mmap_function=None))
+    coordinates_list = dataset.get_image_coordinates_list()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for _ in range(3):
+            list(executor.map(lambda coordinates: dataset.read_image(**coordinates), coordinates_list))
+    readers = list(dataset._readers_by_filename.values())
+    for reader in readers:
+        assert reader._num_spare_files == len(reader._spare_files) <= _MAX_SPARE_FILES
+
+    # a handle in use while the dataset is closed is closed when it is given back
+    reader = readers[0]
+    reader._spare_files.append(NoDescriptorFile(reader.tiff_path, "rb"))
+    reader._num_spare_files += 1
+    spare_file = reader._take_spare_file()
+    dataset.close()
+    assert not spare_file.closed
+    reader._give_back_spare_file(spare_file)
+    assert all(file.closed for file in NoDescriptorFile.opened)
+    assert all(reader._num_spare_files == 0 for reader in readers)
+
+
+def test_files_opened_outside_dataset_lock(test_data_path):
+    # files are opened when an image in them is first read, which mustn't hold up other threads using the dataset
+    data_path = os.path.join(test_data_path, 'v3', 'ndtiff3.2_multichannel')
+    dataset = None
+    dataset_lock_free = []
+
+    def try_dataset_lock():
+        acquired = dataset._lock.acquire(blocking=False)
+        if acquired:
+            dataset._lock.release()
+        dataset_lock_free.append(acquired)
+
+    def open_function(*args, **kwargs):
+        if dataset is not None:
+            # try the lock from another thread, since it is reentrant
+            thread = threading.Thread(target=try_dataset_lock)
+            thread.start()
+            thread.join()
+        return open(*args, **kwargs)
+
+    dataset = Dataset(data_path, file_io=file_io.NDTiffFileIO(open_function=open_function))
+    coordinates_list = dataset.get_image_coordinates_list()
+    for read in (lambda: dataset.read_image(**coordinates_list[0]),
+                 lambda: dataset.read_metadata(**coordinates_list[0]),
+                 lambda: dataset._read_image_if_present(coordinates_list[0]),
+                 lambda: dataset._read_images_batch(coordinates_list[:2])):
+        # close the file so that it is opened again by the next read
+        for reader in list(dataset._readers_by_filename.values()):
+            reader.close()
+        dataset._readers_by_filename.clear()
+        dataset_lock_free.clear()
+        read()
+        assert dataset_lock_free and all(dataset_lock_free)
+    dataset.close()
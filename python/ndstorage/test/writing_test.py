@@ -5,12 +5,13 @@ from ndstorage.ndtiff_file import SingleNDTiffWriter, SingleNDTiffReader
 from ndstorage.ndtiff_dataset import NDTiffDataset
 from ndstorage.ndram_dataset import NDRAMDataset
 import pytest
+import gc
+import weakref
+import struct
 
 @pytest.fixture(scope="function")
 def test_data_path(tmp_path_factory):
     data_path = tmp_path_factory.mktemp('writer_tests')
-    for f in os.listdir(data_path):
-        os.remove(os.path.join(data_path, f))
     yield str(data_path)
     shutil.rmtree(data_path)
 
@@ -35,6 +36,83 @@ def test_write_single_file(test_data_path):
     assert np.all(read_pixels == pixels)
 
 
+def test_write_rgb_image(test_data_path):
+    """
+    Write an RGB image to a single NDTiff file, and check its IFD and that it reads back in the same channel order
+    """
+    filename = 'test_write_rgb_image.tif'
+    writer = SingleNDTiffWriter(test_data_path, filename, summary_md={})
+    image_height, image_width = 5, 7
+    pixels = np.zeros((image_height, image_width, 3), dtype=np.uint8)
+    pixels[..., 0] = 10
+    pixels[..., 1] = 20
+    pixels[..., 2] = np.arange(image_height * image_width).reshape((image_height, image_width))
+    index_entry = writer.write_image(frozenset({'time': 0}.items()), pixels, {})
+    writer.finished_writing()
+    assert index_entry.pixel_type == SingleNDTiffReader.EIGHT_BIT_RGB
+
+    single_reader = SingleNDTiffReader(os.path.join(test_data_path, filename))
+    read_pixels = single_reader.read_image(index_entry)
+    assert read_pixels.shape == (image_height, image_width, 3)
+    assert np.array_equal(read_pixels, pixels)
+    single_reader.close()
+
+    with open(os.path.join(test_data_path, filename), 'rb') as file:
+        data = file.read()
+    first_ifd_offset, = struct.unpack_from('<I', data, 4)
+    num_entries, = struct.unpack_from('<H', data, first_ifd_offset)
+    entries = {tag: (value_type, count, value) for tag, value_type, count, value in
+               struct.iter_unpack('<HHII', data[first_ifd_offset + 2:first_ifd_offset + 2 + num_entries * 12])}
+    assert entries[256][2] == image_width
+    assert entries[257][2] == image_height
+    # bits per sample: three values, stored outside the entry
+    assert entries[258][:2] == (3, 3)
+    assert struct.unpack_from('<HHH', data, entries[258][2]) == (8, 8, 8)
+    # photometric interpretation RGB, 3 samples per pixel
+    assert entries[262][2] == 2
+    assert entries[277][2] == 3
+    assert entries[273][2] == index_entry.pix_offset
+    assert entries[279][2] == image_height * image_width * 3
+
+
+@pytest.mark.parametrize('use_writev', [True, False])
+def test_write_odd_sized_buffers(test_data_path, monkeypatch, use_writev):
+    """
+    Write images whose pixels and metadata have odd numbers of bytes, and check that every IFD starts on a word
+    and that everything reads back
+    """
+    if not use_writev:
+        monkeypatch.delattr(os, 'writev', raising=False)
+    filename = 'test_write_odd_sized_buffers.tif'
+    writer = SingleNDTiffWriter(test_data_path, filename, summary_md={'odd': 'x'})
+    images = [np.full((3, 5), time, dtype=np.uint8) for time in range(4)]
+    metadata = [{'time': 'x' * time} for time in range(4)]
+    index_entries = [writer.write_image(frozenset({'time': time}.items()), images[time], metadata[time])
+                     for time in range(4)]
+    writer.finished_writing()
+
+    with open(os.path.join(test_data_path, filename), 'rb') as file:
+        data = file.read()
+    ifd_offset, = struct.unpack_from('<I', data, 4)
+    ifd_offsets = []
+    while ifd_offset != 0:
+        ifd_offsets.append(ifd_offset)
+        num_entries, = struct.unpack_from('<H', data, ifd_offset)
+        ifd_offset, = struct.unpack_from('<I', data, ifd_offset + 2 + num_entries * 12)
+    assert len(ifd_offsets) == 4
+    assert all(ifd_offset % 2 == 0 for ifd_offset in ifd_offsets)
+    # each image's metadata ends just before the next IFD (or its padding byte)
+    for index_entry, next_ifd_offset in zip(index_entries, ifd_offsets[1:]):
+        assert next_ifd_offset - (index_entry.metadata_offset + index_entry.metadata_length) in (0, 1)
+
+    single_reader = SingleNDTiffReader(os.path.join(test_data_path, filename))
+    assert single_reader.summary_md == {'odd': 'x'}
+    for time, index_entry in enumerate(index_entries):
+        assert np.array_equal(single_reader.read_image(index_entry), images[time])
+        assert single_reader.read_metadata(index_entry) == metadata[time]
+    single_reader.close()
+
+
 def test_write_full_dataset(test_data_path):
     """
     Write an NDTiff dataset and read it back in, testing pixels and metadata
@@ -46,8 +124,7 @@ def test_write_full_dataset(test_data_path):
     image_width = 256
     images = []
     for time in range(10):
-        pixels = np.ones(image_height * image_width, dtype=np.uint16).reshape((image_height, image_width)) * time
-        images.append(pixels)
+        images.append(np.full((image_height, image_width), time, dtype=np.uint16))
     for time in range(10):
         axes = {'time': time}
         dataset.put_image(axes, images[time], {'time_metadata': time})
@@ -56,13 +133,30 @@ def test_write_full_dataset(test_data_path):
 
     # read the file back in
     dataset = NDTiffDataset(full_path)
+    pixels = np.empty((image_height, image_width), dtype=np.uint16)
     for time in range(10):
-        pixels = np.ones(image_height * image_width, dtype=np.uint16).reshape((image_height, image_width)) * time
+        pixels.fill(time)
         axes = {'time': time}
         read_image = dataset.read_image(**axes)
         assert np.all(read_image == pixels)
         assert dataset.read_metadata(**axes) == {'time_metadata': time}
 
+def test_write_full_dataset_without_writev(test_data_path, monkeypatch):
+    """
+    Where there is no writev (e.g. Windows) images are written through the file object's buffer. They must still
+    be readable as soon as put_image returns
+    """
+    monkeypatch.delattr(os, 'writev', raising=False)
+    full_path = os.path.join(test_data_path, 'test_write_full_dataset_without_writev')
+    dataset = NDTiffDataset(full_path, summary_metadata={}, writable=True)
+    images = [np.full((256, 256), time, dtype=np.uint16) for time in range(5)]
+    for time in range(5):
+        dataset.put_image({'time': time}, images[time], {'time_metadata': time})
+        assert np.array_equal(dataset.read_image(time=time), images[time])
+        assert dataset.read_metadata(time=time) == {'time_metadata': time}
+    dataset.finish()
+    dataset.close()
+
 def test_write_full_dataset_8_bit(test_data_path):
     """
     Write an NDTiff dataset and read it back in, testing pixels and metadata
@@ -74,8 +168,7 @@ def test_write_full_dataset_8_bit(test_data_path):
     image_width = 256
     images = []
     for time in range(10):
-        pixels = np.ones(image_height * image_width, dtype=np.uint16).reshape((image_height, image_width)) * time
-        images.append(pixels)
+        images.append(np.full((image_height, image_width), time, dtype=np.uint16))
     for time in range(10):
         axes = {'time': time}
         dataset.put_image(axes, images[time], {'time_metadata': time})
@@ -84,13 +177,50 @@ def test_write_full_dataset_8_bit(test_data_path):
 
     # read the file back in
     dataset = NDTiffDataset(full_path)
+    pixels = np.empty((image_height, image_width), dtype=np.uint8)
     for time in range(10):
-        pixels = np.ones(image_height * image_width, dtype=np.uint8).reshape((image_height, image_width)) * time
+        pixels.fill(time)
         axes = {'time': time}
         read_image = dataset.read_image(**axes)
         assert np.all(read_image == pixels)
         assert dataset.read_metadata(**axes) == {'time_metadata': time}
 
+def test_files_being_written_not_memory_mapped(test_data_path):
+    """
+    Files of a dataset being written can't be memory mapped, since the writer resizes them when it finishes,
+    which fails for mapped files on some platforms. Once the dataset is read back from disk they are
+    """
+    full_path = os.path.join(test_data_path, 'test_files_being_written_not_memory_mapped')
+    dataset = NDTiffDataset(full_path, summary_metadata={}, writable=True)
+    for time in range(3):
+        dataset.put_image({'time': time}, np.full((64, 64), time, dtype=np.uint16), {})
+        assert len(dataset._readers_by_filename) > 0
+        assert all(reader.mm is None for reader in dataset._readers_by_filename.values())
+    dataset.finish()
+
+    dataset = NDTiffDataset(full_path)
+    assert np.all(dataset.read_image(time=2) == 2)
+    assert all(reader.mm is not None for reader in dataset._readers_by_filename.values())
+    dataset.close()
+
+def test_string_axis_positions_of_other_types(test_data_path):
+    """
+    Integer positions of string-valued axes are converted to strings only when they are plain ints, whatever
+    positions of other types were looked up before
+    """
+    full_path = os.path.join(test_data_path, 'test_string_axis_positions_of_other_types')
+    dataset = NDTiffDataset(full_path, summary_metadata={}, writable=True)
+    for channel in ('DAPI', 'GFP'):
+        dataset.put_image({'channel': channel, 'z': 0, 'filter': channel}, np.zeros((8, 8), dtype=np.uint16), {})
+    dataset.finish()
+
+    for position in (np.int64(1), True, 1.0):
+        dataset.has_image(channel=position, z=0, filter='GFP')
+        assert dataset.has_image(channel=1, z=0, filter='GFP')
+        dataset.has_image(channel='GFP', z=0, filter=position)
+        assert dataset.has_image(channel='GFP', z=0, filter=1)
+    dataset.close()
+
 def test_write_full_dataset_RAM():
     dataset = NDRAMDataset()
 
@@ -98,20 +228,76 @@ def test_write_full_dataset_RAM():
     image_width = 256
     images = []
     for time in range(10):
-        pixels = np.ones(image_height * image_width, dtype=np.uint16).reshape((image_height, image_width)) * time
-        images.append(pixels)
+        images.append(np.full((image_height, image_width), time, dtype=np.uint16))
     for time in range(10):
         axes = {'time': time}
         dataset.put_image(axes, images[time], {'time_metadata': time})
 
     dataset.finish()
 
+    pixels = np.empty((image_height, image_width), dtype=np.uint16)
     for time in range(10):
-        pixels = np.ones(image_height * image_width, dtype=np.uint16).reshape((image_height, image_width)) * time
+        pixels.fill(time)
         axes = {'time': time}
         read_image = dataset.read_image(**axes)
         assert np.all(read_image == pixels)
         assert dataset.read_metadata(**axes) == {'time_metadata': time}
 
+def test_RAM_string_axis_positions_of_other_types():
+    """
+    Integer positions of string-valued axes are converted to strings only when they are plain ints, whatever
+    positions of other types were looked up before
+    """
+    dataset = NDRAMDataset()
+    image = np.zeros((8, 8), dtype=np.uint16)
+    for channel in ('DAPI', 'GFP'):
+        dataset.put_image({'channel': channel, 'z': 0, 'filter': channel}, image, {})
+    dataset.finish()
+
+    for position in (np.int64(1), True, 1.0):
+        dataset.has_image(channel=position, z=0, filter='GFP')
+        assert dataset.has_image(channel=1, z=0, filter='GFP')
+        dataset.has_image(channel='GFP', z=0, filter=position)
+        assert dataset.has_image(channel='GFP', z=0, filter=1)
+
+def test_RAM_dataset_freed_without_garbage_collection():
+    """
+    Memoized image keys mustn't make a reference cycle through the dataset
+    """
+    dataset = NDRAMDataset()
+    dataset.put_image({'time': 0}, np.zeros((8, 8), dtype=np.uint16), {})
+    assert dataset.has_image(time=0)
+    dataset_ref = weakref.ref(dataset)
+    gc.disable()
+    try:
+        del dataset
+        assert dataset_ref() is None
+    finally:
+        gc.enable()
 
+def test_RAM_axis_positions_of_wrong_type():
+    """
+    Positions of the wrong type are rejected even when they are equal to a position that has been seen
+    """
+    dataset = NDRAMDataset()
+    image = np.zeros((8, 8), dtype=np.uint16)
+    dataset.put_image({'time': 0, 'channel': 'DAPI'}, image, {})
+    for time in (np.int64(0), False, 0.0):
+        with pytest.raises(RuntimeError):
+            dataset.put_image({'time': time, 'channel': 'DAPI'}, image, {})
 
+def test_RAM_replaced_images_metadata():
+    """
+    Replacing images, with metadata of the same or different keys, reuses the space of their old metadata
+    """
+    dataset = NDRAMDataset()
+    image = np.zeros((8, 8), dtype=np.uint16)
+    for time in range(2):
+        dataset.put_image({'time': time}, image, {'time_metadata': time})
+    for repeat in range(5):
+        for time in range(2):
+            dataset.put_image({'time': time}, image, {'time_metadata': time, 'repeat': repeat})
+            assert dataset.read_metadata(time=time) == {'time_metadata': time, 'repeat': repeat}
+            dataset.put_image({'time': time}, image, {'time_metadata': repeat})
+            assert dataset.read_metadata(time=time) == {'time_metadata': repeat}
+    assert all(len(column) == 2 for column in dataset._metadata_columns)
@@ -29,6 +29,10 @@ setuptools.setup(
     extras_require={
         "test": [
             "pytest",
+        ],
+        # faster parsing of metadata and index files
+        "orjson": [
+            "orjson",
         ]
     },
     classifiers=[